@@ -5,7 +5,165 @@ SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 1440))
 
+# Comma-separated usernames allowed on /admin and the model management
+# endpoints. Empty means nobody is.
+ADMIN_USERNAMES = frozenset(name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip())
+
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://postgres:postgres@db:5432/chatapp"
 )
+
+# Micro-batching for toxicity inference on the WebSocket path. A message waits
+# at most TOXICITY_BATCH_WAIT_MS for companions before its batch is scored.
+TOXICITY_BATCH_SIZE = int(os.getenv("TOXICITY_BATCH_SIZE", 32))
+TOXICITY_BATCH_WAIT_MS = float(os.getenv("TOXICITY_BATCH_WAIT_MS", 10))
+TOXICITY_WORKERS = int(os.getenv("TOXICITY_WORKERS", 2))
+
+# Toxicity result cache; the model registry state is re-checked at most every
+# TOXICITY_CACHE_CHECK_SECONDS and a version change clears the cache.
+TOXICITY_CACHE_SIZE = int(os.getenv("TOXICITY_CACHE_SIZE", 10000))
+TOXICITY_CACHE_TTL = float(os.getenv("TOXICITY_CACHE_TTL", 3600))
+TOXICITY_CACHE_CHECK_SECONDS = float(os.getenv("TOXICITY_CACHE_CHECK_SECONDS", 5))
+
+# Load the toxicity model in a background thread at startup instead of on the
+# first scored message.
+TOXICITY_WARMUP = os.getenv("TOXICITY_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Runtime for SBERT encoders: "torch" (the reference), "onnx" or "onnx-int8"
+# (ONNX Runtime, exported on first load; dynamic int8 quantization for the
+# latter). Compare them with benchmarks/bench_encoder.py before switching.
+# TOXICITY_ONNX_THREADS=0 leaves the intra-op thread count to ONNX Runtime.
+TOXICITY_ENCODER_BACKEND = os.getenv("TOXICITY_ENCODER_BACKEND", "torch").lower()
+TOXICITY_ONNX_THREADS = int(os.getenv("TOXICITY_ONNX_THREADS", 0))
+
+# Versioned toxicity models (app.services.model_registry). Defaults to
+# app/models/registry. A shadow candidate scores a sample of live traffic on
+# one background thread; beyond MODEL_SHADOW_MAX_PENDING queued batches,
+# samples are dropped rather than delaying anything.
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "")
+MODEL_SHADOW_MAX_PENDING = int(os.getenv("MODEL_SHADOW_MAX_PENDING", 4))
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 200))
+
+# Bulk encrypt/decrypt: lists longer than ENCRYPTION_CHUNK_SIZE are split into
+# chunks processed on ENCRYPTION_WORKERS threads.
+ENCRYPTION_WORKERS = int(os.getenv("ENCRYPTION_WORKERS", 4))
+ENCRYPTION_CHUNK_SIZE = int(os.getenv("ENCRYPTION_CHUNK_SIZE", 64))
+ENCRYPTION_KEY_CACHE_SIZE = int(os.getenv("ENCRYPTION_KEY_CACHE_SIZE", 4096))
+
+# Frames buffered per WebSocket before the client is treated as a slow
+# consumer and disconnected.
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", 256))
+
+# Inbound WebSocket limits, per worker. At most WS_MAX_CONNECTIONS sessions
+# (0: unlimited); more are closed with 1013. Messages and typing events each
+# have a token bucket per connection, per user and per room, refilling at the
+# given rate per second (0 disables one) and holding WS_RATE_BURST_SECONDS of
+# it. Over-limit typing events are dropped; over-limit messages are refused
+# with a "rate_limited" frame, and WS_RATE_LIMIT_STRIKES of those in a row on
+# the connection's or user's own limit (not the room's) close the socket with
+# 1008. Up to WS_INBOUND_QUEUE_SIZE frames wait to be processed; past that
+# typing events are dropped and a message closes the socket with 1013.
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", 5000))
+WS_MESSAGE_RATE_PER_CONNECTION = float(os.getenv("WS_MESSAGE_RATE_PER_CONNECTION", 5))
+WS_MESSAGE_RATE_PER_USER = float(os.getenv("WS_MESSAGE_RATE_PER_USER", 10))
+WS_MESSAGE_RATE_PER_ROOM = float(os.getenv("WS_MESSAGE_RATE_PER_ROOM", 100))
+WS_TYPING_RATE_PER_CONNECTION = float(os.getenv("WS_TYPING_RATE_PER_CONNECTION", 2))
+WS_TYPING_RATE_PER_USER = float(os.getenv("WS_TYPING_RATE_PER_USER", 4))
+WS_TYPING_RATE_PER_ROOM = float(os.getenv("WS_TYPING_RATE_PER_ROOM", 50))
+WS_RATE_BURST_SECONDS = float(os.getenv("WS_RATE_BURST_SECONDS", 2))
+WS_RATE_LIMIT_STRIKES = int(os.getenv("WS_RATE_LIMIT_STRIKES", 20))
+WS_INBOUND_QUEUE_SIZE = int(os.getenv("WS_INBOUND_QUEUE_SIZE", 32))
+
+# Typing indicators are coalesced: each room gets at most one "who is typing"
+# frame per TYPING_TICK_MS, and a member who sends no typing event for
+# TYPING_TIMEOUT seconds stops being listed.
+TYPING_TICK_MS = float(os.getenv("TYPING_TICK_MS", 250))
+TYPING_TIMEOUT = float(os.getenv("TYPING_TIMEOUT", 5))
+
+# How room events reach other workers: "memory" (single process) or
+# "postgres" (LISTEN/NOTIFY on DATABASE_URL).
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory").lower()
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "chat_events")
+
+# SQLAlchemy pool settings (ignored for SQLite) and the thread pool that runs
+# database work for async handlers. DB_POOL_RECYCLE is in seconds, -1 to keep
+# connections forever; DB_POOL_PRE_PING tests each connection on checkout.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Apply pending migrations during startup; turn off to run them separately
+# with `python -m app.database.migrate`.
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", 8))
+
+# Write-behind message persistence. MESSAGE_DURABILITY=commit broadcasts a
+# message only after its batch is committed; "async" broadcasts immediately.
+# In both modes a batch that fails for a transient reason (connection, lock)
+# is retried up to MESSAGE_WRITE_RETRIES times; one rejected for a bad row is
+# split until that row is isolated.
+#
+# Ids are reserved MESSAGE_ID_BLOCK at a time, so with several workers id
+# order is not send order; history pages by (timestamp, id) instead.
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", 100))
+MESSAGE_FLUSH_MS = float(os.getenv("MESSAGE_FLUSH_MS", 20))
+MESSAGE_DURABILITY = os.getenv("MESSAGE_DURABILITY", "commit").lower()
+MESSAGE_ID_BLOCK = int(os.getenv("MESSAGE_ID_BLOCK", 100))
+MESSAGE_WRITE_RETRIES = int(os.getenv("MESSAGE_WRITE_RETRIES", 3))
+
+# GET /rooms page size and its short-lived result cache.
+ROOM_PAGE_SIZE = int(os.getenv("ROOM_PAGE_SIZE", 50))
+ROOM_MAX_PAGE_SIZE = int(os.getenv("ROOM_MAX_PAGE_SIZE", 200))
+ROOM_DIRECTORY_CACHE_SIZE = int(os.getenv("ROOM_DIRECTORY_CACHE_SIZE", 1000))
+ROOM_DIRECTORY_CACHE_TTL = float(os.getenv("ROOM_DIRECTORY_CACHE_TTL", 5))
+
+# Room name -> (id, key) cache used when resolving rooms on connect.
+ROOM_CACHE_SIZE = int(os.getenv("ROOM_CACHE_SIZE", 10000))
+ROOM_CACHE_TTL = float(os.getenv("ROOM_CACHE_TTL", 3600))
+
+# Verified-token and user caches used by get_user_from_token. Entries never
+# outlive the token's exp; AUTH_CACHE_TTL bounds how long another worker can
+# serve a user row that was changed elsewhere.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 300))
+
+# Password hashing runs on PASSWORD_HASH_WORKERS processes. Up to
+# PASSWORD_HASH_QUEUE more requests wait for a worker, each for at most
+# PASSWORD_HASH_TIMEOUT seconds, before /auth answers 503. Changing
+# BCRYPT_ROUNDS rehashes each user's password at their next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 64))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+
+# Background jobs (model retraining) run in their own processes, at most
+# JOB_MAX_RUNNING at a time; the last JOB_HISTORY jobs stay queryable.
+# Retraining streams messages from the database RETRAIN_YIELD_PER rows at a time.
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", 1))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", 50))
+RETRAIN_YIELD_PER = int(os.getenv("RETRAIN_YIELD_PER", 1000))
+
+# Statement timing and pool instrumentation, reported at /admin/db. A request
+# running one statement SQL_N_PLUS_ONE_THRESHOLD or more times is flagged.
+SQL_PROFILING = os.getenv("SQL_PROFILING", "true").lower() in ("1", "true", "yes")
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 10))
+
+# GET /metrics in the Prometheus text format, one registry per worker process.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Root log level for the app's loggers (DEBUG, INFO, WARNING, ...).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Event-loop monitoring, reported at /admin/loop and /metrics. The loop is
+# sampled every LOOP_LAG_INTERVAL_MS; a step holding it LOOP_BLOCK_THRESHOLD_MS
+# or more has its stack (innermost LOOP_STACK_DEPTH frames) recorded, and the
+# last LOOP_BLOCK_HISTORY of those are kept.
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() in ("1", "true", "yes")
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", 50))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", 100))
+LOOP_BLOCK_HISTORY = int(os.getenv("LOOP_BLOCK_HISTORY", 50))
+LOOP_STACK_DEPTH = int(os.getenv("LOOP_STACK_DEPTH", 30))
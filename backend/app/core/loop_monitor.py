@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from app.core.config import LOOP_BLOCK_HISTORY, LOOP_BLOCK_THRESHOLD_MS, LOOP_LAG_INTERVAL_MS, LOOP_STACK_DEPTH
+from app.core.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds", "How late the loop ran a sleep that was due", buckets=LAG_BUCKETS
+)
+LOOP_BLOCKS = metrics.counter(
+    "event_loop_blocks_total", "Times one step held the event loop past the threshold", ("route",)
+)
+LOOP_BLOCK_SECONDS = metrics.histogram(
+    "event_loop_block_duration_seconds", "How long a detected blocking step held the loop", buckets=LAG_BUCKETS
+)
+
+# Locals that name the room a frame is working on: the chat routes take
+# chat_id, the connection manager room_name, POST /rooms/{room_id}/join room_id.
+_ROOM_LOCALS = ("chat_id", "room_name", "room_id")
+
+def _attribute(frame) -> Tuple[str, Optional[str]]:
+    # Route and room of a captured stack, read from the frames themselves: the
+    # ASGI middlewares hold the request scope (routing has filled in the
+    # template and path params by the time an endpoint runs), background work
+    # only has the room locals. Only frames whose code declares one of these
+    # names have their locals read.
+    route, room = "-", None
+    while frame is not None:
+        names = frame.f_code.co_varnames
+        if route == "-" and "scope" in names:
+            scope = frame.f_locals.get("scope")
+            if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+                template = getattr(scope.get("route"), "path", None)
+                route = template or "unmatched"
+                params = scope.get("path_params") or {}
+                for name in _ROOM_LOCALS:
+                    if room is None and name in params:
+                        room = str(params[name])
+        if room is None:
+            for name in _ROOM_LOCALS:
+                if name in names:
+                    value = frame.f_locals.get(name)
+                    if isinstance(value, (str, int)):
+                        room = str(value)
+                        break
+        frame = frame.f_back
+    return route, room
+
+class LoopMonitor:
+    # Scheduling delay of the event loop, and the stacks of steps that block it.
+    #
+    # A task sleeps LOOP_LAG_INTERVAL_MS at a time and records how late each
+    # wake-up is; every wake-up is also a heartbeat. A watchdog thread checks
+    # the heartbeat, and when the loop is LOOP_BLOCK_THRESHOLD_MS overdue it
+    # captures the loop thread's stack, still inside the blocking call. Steady
+    # cost is one wake-up per interval on the loop and one on the thread, so it
+    # stays on in production. Any block longer than threshold + interval is
+    # caught; shorter ones only show up in the lag histogram.
+
+    def __init__(self, interval_ms: float, threshold_ms: float, history: int, stack_depth: int):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.stack_depth = stack_depth
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._due = 0.0
+        self._open_block: Optional[Dict[str, Any]] = None
+        self.recent_lag: Deque[float] = deque(maxlen=max(1, int(60 / self.interval)))
+        self.blocks: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples = 0
+            self.max_lag = 0.0
+            self.blocks_total = 0
+            self.blocks_by_route: Dict[str, int] = {}
+            self.recent_lag.clear()
+            self.blocks.clear()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._due = time.perf_counter() + self.interval
+        self._stopping.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _sample(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - self._due)
+            LOOP_LAG_SECONDS.observe(lag)
+            with self._lock:
+                self._due = now + self.interval
+                self.samples += 1
+                self.recent_lag.append(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+                block, self._open_block = self._open_block, None
+                if block is not None:
+                    block["blocked_ms"] = round(lag * 1000, 1)
+            if block is not None:
+                LOOP_BLOCK_SECONDS.observe(lag)
+                logger.warning(
+                    "Event loop blocked for %.0f ms in %s (room %s)",
+                    lag * 1000, block["route"], block["room"],
+                )
+
+    def _watch(self):
+        check = min(self.interval, self.threshold) / 2
+        captured_due = 0.0
+        while not self._stopping.wait(check):
+            due = self._due
+            if due == captured_due or time.perf_counter() - due < self.threshold:
+                continue
+            captured_due = due
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._capture(frame, due)
+
+    def _capture(self, frame, due: float):
+        overdue = time.perf_counter() - due
+        route, room = _attribute(frame)
+        stack = traceback.format_stack(frame)[-self.stack_depth:]
+        block = {
+            "at": time.time(),
+            "route": route,
+            "room": room,
+            # Grows to the full duration when the loop gets back to the sampler.
+            "blocked_ms": round(overdue * 1000, 1),
+            "stack": [line.rstrip() for line in stack],
+        }
+        with self._lock:
+            if self._due != due:
+                # The loop moved on while the stack was read; it is not the blocker.
+                return
+            self.blocks_total += 1
+            self.blocks_by_route[route] = self.blocks_by_route.get(route, 0) + 1
+            self.blocks.append(block)
+            self._open_block = block
+        LOOP_BLOCKS.labels(route).inc()
+
+    def stats(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            lags = sorted(self.recent_lag)
+            blocks = list(self.blocks)[-limit:] if limit else []
+            by_route = dict(self.blocks_by_route)
+            last = self.recent_lag[-1] if self.recent_lag else 0.0
+            samples, max_lag, total = self.samples, self.max_lag, self.blocks_total
+
+        def pct(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(len(lags) * p / 100))] * 1000, 2)
+
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "samples": samples,
+                "last": round(last * 1000, 2),
+                "p50": pct(50),
+                "p99": pct(99),
+                "max_recent": pct(100),
+                "max": round(max_lag * 1000, 2),
+            },
+            "blocks": {
+                "total": total,
+                "by_route": by_route,
+                "recent": list(reversed(blocks)),
+            },
+        }
+
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS, LOOP_BLOCK_HISTORY, LOOP_STACK_DEPTH)
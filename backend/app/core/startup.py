@@ -0,0 +1,32 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Set
+from app.core.config import LOG_LEVEL
+
+# Milliseconds spent in each startup phase (imports, init_db, model_load, ...).
+timings: Dict[str, float] = {}
+# Steps that finished successfully. A phase in timings may have raised;
+# readiness checks these instead.
+completed: Set[str] = set()
+
+def record(phase: str, seconds: float):
+    timings[phase] = round(seconds * 1000, 2)
+
+def mark(step: str):
+    completed.add(step)
+
+def is_done(step: str) -> bool:
+    return step in completed
+
+@contextmanager
+def timed(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+def configure_logging():
+    # Once per process: the API worker and each spawned job process.
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
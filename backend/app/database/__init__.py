@@ -1,4 +1,5 @@
 from .database import engine, SessionLocal, Base, get_db
+from .executor import run_db
 from .init_db import init_db
 
-__all__ = ["engine", "SessionLocal", "Base", "get_db", "init_db"]
+__all__ = ["engine", "SessionLocal", "Base", "get_db", "run_db", "init_db"]
@@ -1,9 +1,35 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from typing import Generator
-from app.core.config import DATABASE_URL
+from app.core.config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    SQL_PROFILING,
+)
+from app.database.profiling import TimedQueuePool, profiler
 
-engine = create_engine(DATABASE_URL, echo=False)
+def _engine_options() -> dict:
+    if DATABASE_URL.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if SQL_PROFILING:
+        options["poolclass"] = TimedQueuePool
+    return options
+
+engine = create_engine(DATABASE_URL, echo=False, **_engine_options())
+
+if SQL_PROFILING:
+    profiler.install(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,35 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+from sqlalchemy.orm import sessionmaker
+from app.core.config import DB_EXECUTOR_WORKERS
+from app.database.database import engine
+
+T = TypeVar("T")
+
+# Sessions used from async code live on a dedicated thread pool, so a slow
+# Postgres round-trip only ever occupies one of these threads. Objects are not
+# expired on commit: callers get back detached rows they can still read.
+ExecutorSession = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+def _run(fn: Callable[..., T], args: tuple) -> T:
+    db = ExecutorSession()
+    try:
+        return fn(db, *args)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    # fn(db, *args) runs in a fresh session on the database thread pool.
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, ctx.run, _run, fn, args)
+
+def shutdown_executor():
+    _executor.shutdown(wait=False)
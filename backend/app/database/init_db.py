@@ -1,8 +1,12 @@
+import logging
+from app.core.config import DB_MIGRATE_ON_STARTUP
 from app.database.database import Base, engine
 import importlib
 import pkgutil
 import app.models
 
+logger = logging.getLogger(__name__)
+
 def import_all_models():
     package = app.models
     for _, module_name, _ in pkgutil.iter_modules(package.__path__):
@@ -10,11 +14,16 @@ def import_all_models():
         try:
             importlib.import_module(full_module)
         except Exception as e:
-            print(f"Failed to import model module {full_module}: {e}")
+            logger.warning("Failed to import model module %s: %s", full_module, e)
 
-def init_db():
-    print("init_db() Importing model modules...")
+def init_db(migrate: bool = DB_MIGRATE_ON_STARTUP):
+    logger.info("init_db() Importing model modules...")
     import_all_models()
-    print("Creating tables (if not exist)...")
+    logger.info("Creating tables (if not exist)...")
     Base.metadata.create_all(bind=engine)
-    print("Database initialization complete.")
+    if migrate:
+        from app.database.migrate import run_migrations
+
+        logger.info("Applying schema migrations...")
+        run_migrations(engine)
+    logger.info("Database initialization complete.")
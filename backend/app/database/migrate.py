@@ -0,0 +1,135 @@
+import argparse
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Applied versions live in their own table, outside Base.metadata.
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Held for the whole run so workers starting together migrate one at a time.
+_LOCK_ID = 0x6D696772
+
+def load_migrations() -> list:
+    import app.database.migrations as package
+
+    found = []
+    for _, module_name, _ in pkgutil.iter_modules(package.__path__):
+        module = importlib.import_module(f"{package.__name__}.{module_name}")
+        found.append(module)
+    found.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return found
+
+def create_index(
+    conn: Connection,
+    name: str,
+    table: str,
+    columns: List[str],
+    where: Optional[dict] = None,
+    using: Optional[str] = None,
+):
+    # Builds without blocking writes on Postgres (CREATE INDEX CONCURRENTLY,
+    # so conn must be in AUTOCOMMIT). `where` maps dialect name to a partial
+    # index predicate written the way that dialect's queries render it.
+    dialect = conn.dialect.name
+    cols = ", ".join(columns)
+    predicate = (where or {}).get(dialect)
+    suffix = f" WHERE {predicate}" if predicate else ""
+    method = f" USING {using}" if using else ""
+
+    if dialect == "postgresql":
+        # An interrupted concurrent build leaves an INVALID index behind that
+        # IF NOT EXISTS would happily skip; drop it and start over.
+        invalid = conn.execute(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}{method} ({cols}){suffix}"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table}{method} ({cols}){suffix}"))
+
+def add_column(conn: Connection, table: str, name: str, ddl_type: str):
+    # Nullable and without a default, so Postgres only touches the catalog
+    # rather than rewriting the table.
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {ddl_type}"))
+    elif name not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+def applied_versions(conn: Connection) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return {row[0] for row in conn.execute(schema_migrations.select().with_only_columns(schema_migrations.c.version))}
+
+def run_migrations(engine: Engine, target: Optional[int] = None) -> List[int]:
+    migrations = load_migrations()
+    done: List[int] = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _LOCK_ID})
+        try:
+            applied = applied_versions(conn)
+            for migration in migrations:
+                if migration.VERSION in applied or (target is not None and migration.VERSION > target):
+                    continue
+                logger.info("Applying migration %s: %s", migration.VERSION, migration.DESCRIPTION)
+                if migration.upgrade(conn) is False:
+                    logger.warning("Migration %s deferred; it will be retried on the next run", migration.VERSION)
+                    continue
+                conn.execute(
+                    schema_migrations.insert().values(
+                        version=migration.VERSION,
+                        description=migration.DESCRIPTION,
+                        applied_at=datetime.utcnow(),
+                    )
+                )
+                done.append(migration.VERSION)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--list", action="store_true", help="show migrations and whether they are applied")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    args = parser.parse_args()
+
+    from app.database.database import engine
+    from app.database.init_db import init_db
+
+    if args.list:
+        with engine.connect() as conn:
+            applied = applied_versions(conn)
+            conn.commit()
+        for migration in load_migrations():
+            state = "applied" if migration.VERSION in applied else "pending"
+            print(f"{migration.VERSION:>5}  {state:<8} {migration.DESCRIPTION}")
+        return
+
+    init_db(migrate=False)
+    done = run_migrations(engine, args.target)
+    print(f"Applied {len(done)} migration(s)" + (f": {done}" if done else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# Versioned schema changes, applied in VERSION order by app.database.migrate.
+# Each module defines VERSION (int), DESCRIPTION and upgrade(conn), where conn
+# is an AUTOCOMMIT connection. upgrade() returning False leaves the version
+# unrecorded so it is tried again on the next run. Changes must also be
+# reflected in the models so fresh databases built by create_all match
+# migrated ones.
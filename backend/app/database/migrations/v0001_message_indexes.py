@@ -0,0 +1,18 @@
+from app.database.migrate import create_index
+
+VERSION = 1
+DESCRIPTION = "Composite and foreign-key indexes on messages"
+
+def upgrade(conn):
+    # History pages by id, retraining and exports by time, user deletes by sender.
+    create_index(conn, "ix_messages_room_id_id", "messages", ["room_id", "id"])
+    create_index(conn, "ix_messages_room_id_timestamp", "messages", ["room_id", "timestamp"])
+    create_index(conn, "ix_messages_sender_id", "messages", ["sender_id"])
+    # Filtered history only ever reads non-toxic rows.
+    create_index(
+        conn,
+        "ix_messages_room_id_id_visible",
+        "messages",
+        ["room_id", "id"],
+        where={"postgresql": "is_toxic = false", "sqlite": "is_toxic = 0"},
+    )
@@ -0,0 +1,9 @@
+from app.database.migrate import create_index
+
+VERSION = 2
+DESCRIPTION = "room_id indexes on user_rooms and room_user_settings"
+
+def upgrade(conn):
+    # Their unique constraints lead with user_id, so deleting a room scanned both tables.
+    create_index(conn, "ix_user_rooms_room_id", "user_rooms", ["room_id"])
+    create_index(conn, "ix_room_user_settings_room_id", "room_user_settings", ["room_id"])
@@ -0,0 +1,21 @@
+import logging
+from sqlalchemy import text
+from app.database.migrate import create_index
+
+logger = logging.getLogger(__name__)
+
+VERSION = 3
+DESCRIPTION = "pg_trgm index on chat_rooms.name for directory search"
+
+def upgrade(conn):
+    # Postgres only: other databases search through the in-memory index in
+    # app.services.room_directory. Not declared on the model, because
+    # create_all runs before this migration has installed the extension.
+    if conn.dialect.name != "postgresql":
+        return
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        logger.warning("pg_trgm unavailable, room search stays unindexed for now: %s", e)
+        return False
+    create_index(conn, "ix_chat_rooms_name_trgm", "chat_rooms", ["name gin_trgm_ops"], using="gin")
@@ -0,0 +1,7 @@
+from app.database.migrate import add_column
+
+VERSION = 4
+DESCRIPTION = "messages.model_version: registry version that scored each message"
+
+def upgrade(conn):
+    add_column(conn, "messages", "model_version", "VARCHAR(64)")
@@ -0,0 +1,52 @@
+from sqlalchemy import text
+from app.database.migrate import add_column
+
+VERSION = 5
+DESCRIPTION = "chat_rooms.member_count, kept by triggers on user_rooms"
+
+def upgrade(conn):
+    # Room search orders by member count; reading a stored count keeps it from
+    # counting user_rooms for every matching room. Triggers rather than app
+    # code, so user deletes cascading into user_rooms are counted too.
+    add_column(conn, "chat_rooms", "member_count", "INTEGER NOT NULL DEFAULT 0")
+    if conn.dialect.name == "postgresql":
+        conn.execute(
+            text(
+                "CREATE OR REPLACE FUNCTION user_rooms_member_count() RETURNS trigger AS $$ "
+                "BEGIN "
+                "IF TG_OP = 'INSERT' THEN "
+                "UPDATE chat_rooms SET member_count = member_count + 1 WHERE id = NEW.room_id; "
+                "ELSE "
+                "UPDATE chat_rooms SET member_count = member_count - 1 WHERE id = OLD.room_id; "
+                "END IF; "
+                "RETURN NULL; "
+                "END $$ LANGUAGE plpgsql"
+            )
+        )
+        conn.execute(text("DROP TRIGGER IF EXISTS user_rooms_member_count ON user_rooms"))
+        conn.execute(
+            text(
+                "CREATE TRIGGER user_rooms_member_count AFTER INSERT OR DELETE ON user_rooms "
+                "FOR EACH ROW EXECUTE PROCEDURE user_rooms_member_count()"
+            )
+        )
+    else:
+        conn.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS user_rooms_member_count_insert AFTER INSERT ON user_rooms "
+                "BEGIN UPDATE chat_rooms SET member_count = member_count + 1 WHERE id = NEW.room_id; END"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS user_rooms_member_count_delete AFTER DELETE ON user_rooms "
+                "BEGIN UPDATE chat_rooms SET member_count = member_count - 1 WHERE id = OLD.room_id; END"
+            )
+        )
+    # After the triggers, so joins during the backfill are not lost.
+    conn.execute(
+        text(
+            "UPDATE chat_rooms SET member_count = "
+            "(SELECT COUNT(*) FROM user_rooms WHERE user_rooms.room_id = chat_rooms.id)"
+        )
+    )
@@ -0,0 +1,16 @@
+from app.database.migrate import create_index
+
+VERSION = 6
+DESCRIPTION = "(room_id, timestamp, id) indexes for history pages"
+
+def upgrade(conn):
+    # History is ordered by (timestamp, id): ids are reserved in blocks per
+    # worker, so id order alone does not follow send order.
+    create_index(conn, "ix_messages_room_id_timestamp_id", "messages", ["room_id", "timestamp", "id"])
+    create_index(
+        conn,
+        "ix_messages_room_id_timestamp_id_visible",
+        "messages",
+        ["room_id", "timestamp", "id"],
+        where={"postgresql": "is_toxic = false", "sqlite": "is_toxic = 0"},
+    )
@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from app.core.config import SQL_N_PLUS_ONE_THRESHOLD
+
+# The ASGI scope of the request being served. Routing fills in scope["route"]
+# before the endpoint runs, so statements are labelled with the route template
+# ("/chat/{chat_id}/history") rather than the raw path.
+_current_scope: ContextVar[Optional[dict]] = ContextVar("sql_profiler_scope", default=None)
+# Normalized statement -> executions within the current HTTP request.
+_request_counts: ContextVar[Optional[Dict[str, int]]] = ContextVar("sql_profiler_counts", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|\?|:\w+|\$\d+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    s = _STRING.sub("?", statement)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _IN_LIST.sub("(?)", s)
+    return _SPACE.sub(" ", s).strip()
+
+def _route_label(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "-")
+
+def current_route() -> str:
+    return _route_label(_current_scope.get())
+
+class _Timing:
+    __slots__ = ("count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+        }
+
+class SQLProfiler:
+    # Per-statement and per-route timings from the engine's cursor events,
+    # plus connection pool usage. Statements are grouped after normalization,
+    # so the same query with different parameters is one entry.
+
+    def __init__(self, n_plus_one_threshold: int):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self.engine: Optional[Engine] = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements: Dict[str, _Timing] = {}
+            self.routes: Dict[str, _Timing] = {}
+            self.pool_wait = _Timing()
+            self.pool_checkouts = 0
+            self.pool_timeouts = 0
+            self.max_overflow_seen = 0
+            self.n_plus_one_total = 0
+            self.n_plus_one: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+    def install(self, engine: Engine):
+        self.engine = engine
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine.pool, "checkout", self._on_checkout)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("sql_profiler_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("sql_profiler_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        sql = normalize_sql(statement)
+        route = current_route()
+        with self._lock:
+            self.statements.setdefault(sql, _Timing()).add(elapsed_ms)
+            self.routes.setdefault(route, _Timing()).add(elapsed_ms)
+        counts = _request_counts.get()
+        if counts is not None:
+            counts[sql] = counts.get(sql, 0) + 1
+
+    def _on_checkout(self, dbapi_conn, record, proxy):
+        pool = self.engine.pool if self.engine else None
+        overflow = pool.overflow() if isinstance(pool, QueuePool) else 0
+        with self._lock:
+            self.pool_checkouts += 1
+            if overflow > self.max_overflow_seen:
+                self.max_overflow_seen = overflow
+
+    def record_pool_wait(self, seconds: float, timed_out: bool):
+        with self._lock:
+            self.pool_wait.add(seconds * 1000)
+            if timed_out:
+                self.pool_timeouts += 1
+
+    def finish_request(self, route: str, counts: Dict[str, int]):
+        for sql, count in counts.items():
+            if count >= self.n_plus_one_threshold:
+                with self._lock:
+                    self.n_plus_one_total += 1
+                    self.n_plus_one.append(
+                        {"route": route, "statement": sql, "count": count, "at": time.time()}
+                    )
+
+    def pool_status(self) -> Dict[str, Any]:
+        pool = self.engine.pool if self.engine else None
+        status: Dict[str, Any] = {"class": type(pool).__name__ if pool else None}
+        if isinstance(pool, QueuePool):
+            status.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        with self._lock:
+            status.update(
+                checkouts=self.pool_checkouts,
+                timeouts=self.pool_timeouts,
+                max_overflow_seen=self.max_overflow_seen,
+                wait=self.pool_wait.as_dict(),
+            )
+        return status
+
+    def snapshot(self, limit: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            statements = sorted(self.statements.items(), key=lambda kv: kv[1].total_ms, reverse=True)[:limit]
+            routes = sorted(self.routes.items(), key=lambda kv: kv[1].total_ms, reverse=True)
+            n_plus_one = list(self.n_plus_one)
+            n_plus_one_total = self.n_plus_one_total
+        return {
+            "pool": self.pool_status(),
+            "statements": [{"sql": sql, **t.as_dict()} for sql, t in statements],
+            "routes": [{"route": route, **t.as_dict()} for route, t in routes],
+            "n_plus_one": {
+                "threshold": self.n_plus_one_threshold,
+                "total": n_plus_one_total,
+                "recent": n_plus_one,
+            },
+        }
+
+profiler = SQLProfiler(SQL_N_PLUS_ONE_THRESHOLD)
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that reports how long each checkout waited for a connection.
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            profiler.record_pool_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        profiler.record_pool_wait(time.perf_counter() - start, timed_out=False)
+        return conn
+
+class SQLProfilerMiddleware:
+    # Labels statements with the route serving them. Plain HTTP requests also
+    # count statements, so one query repeated many times is flagged as N+1;
+    # WebSocket sessions are long-lived and are only labelled.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        scope_token = _current_scope.set(scope)
+        counts: Optional[Dict[str, int]] = {} if scope["type"] == "http" else None
+        counts_token = _request_counts.set(counts)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_counts.reset(counts_token)
+            _current_scope.reset(scope_token)
+            if counts:
+                profiler.finish_request(_route_label(scope), counts)
@@ -1,9 +1,31 @@
+import logging
 import os
+import threading
+import time
+
+_imports_started = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
+from app.core import startup
+from app.core.config import LOOP_MONITOR, METRICS_ENABLED, SQL_PROFILING, TOXICITY_WARMUP
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import MetricsMiddleware
+from app.database.executor import shutdown_executor
+from app.database.profiling import SQLProfilerMiddleware
 from app.database.init_db import init_db
-from app.routes import auth, chat, rooms, profile, model
+from app.routes import auth, chat, rooms, profile, model, health, admin, metrics
+from app.services import toxicity
+from app.services.inference import toxicity_batcher
+from app.services.jobs import job_runner
+from app.services.message_writer import message_writer
+from app.services.password_hasher import password_hasher
+from app.services.websocket_manager import manager
+
+startup.record("imports", time.perf_counter() - _imports_started)
+startup.configure_logging()
+logger = logging.getLogger(__name__)
 
 FRONTEND_ORIGINS = [
     "http://localhost:3000",
@@ -24,25 +46,55 @@ def create_app():
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if SQL_PROFILING:
+        app.add_middleware(SQLProfilerMiddleware)
+    if METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
 
     app.include_router(auth.router)
     app.include_router(chat.router)
     app.include_router(rooms.router)
     app.include_router(profile.router)
     app.include_router(model.router)
+    app.include_router(health.router)
+    app.include_router(admin.router)
+    if METRICS_ENABLED:
+        app.include_router(metrics.router)
 
     return app
 
 app = create_app()
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     try:
-        print("Running init_db()...")
-        init_db()
-        print("Database initialization completed.")
+        logger.info("Running init_db()...")
+        with startup.timed("init_db"):
+            init_db()
+        startup.mark("db_ready")
+        logger.info("Database initialization completed.")
     except Exception as e:
-        print("init_db() failed:", e)
+        logger.exception("init_db() failed: %s", e)
+
+    if TOXICITY_WARMUP:
+        threading.Thread(target=toxicity.warm_up, name="toxicity-warmup", daemon=True).start()
+
+    await manager.start()
+    message_writer.start()
+    if LOOP_MONITOR:
+        loop_monitor.start()
+
+    logger.info("Startup timings (ms): %s", startup.timings)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await loop_monitor.stop()
+    await manager.stop()
+    await toxicity_batcher.stop()
+    await message_writer.stop()
+    password_hasher.stop()
+    job_runner.shutdown()
+    shutdown_executor()
 
 def custom_openapi():
     if app.openapi_schema:
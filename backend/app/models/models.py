@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, func, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, func, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from app.database.database import Base
 
@@ -22,6 +22,8 @@ class ChatRoom(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, nullable=False)
     symmetric_key = Column(String(256), nullable=True) 
+    # Added by migration 5, whose triggers on user_rooms keep it current.
+    member_count = Column(Integer, nullable=False, server_default=text("0"))
 
     messages = relationship("Message", back_populates="room", cascade="all, delete-orphan")
     members = relationship("UserRoom", back_populates="room", cascade="all, delete-orphan")
@@ -40,11 +42,36 @@ class Message(Base):
     ciphertext = Column(Text, nullable=False) 
     is_toxic = Column(Boolean, default=False)
     toxicity_prob = Column(Float, default=0.0)
+    # Added by migration 4; NULL for messages scored before the registry.
+    model_version = Column(String(64), nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     sender = relationship("User", back_populates="messages")
     room = relationship("ChatRoom", back_populates="messages")
 
+    # Mirrors migration 1; keep the two in step.
+    __table_args__ = (
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        Index("ix_messages_room_id_timestamp", "room_id", "timestamp"),
+        Index("ix_messages_room_id_timestamp_id", "room_id", "timestamp", "id"),
+        Index("ix_messages_sender_id", "sender_id"),
+        Index(
+            "ix_messages_room_id_id_visible",
+            "room_id",
+            "id",
+            postgresql_where=text("is_toxic = false"),
+            sqlite_where=text("is_toxic = 0"),
+        ),
+        Index(
+            "ix_messages_room_id_timestamp_id_visible",
+            "room_id",
+            "timestamp",
+            "id",
+            postgresql_where=text("is_toxic = false"),
+            sqlite_where=text("is_toxic = 0"),
+        ),
+    )
+
     def __repr__(self):
         return f"<Message(sender_id={self.sender_id}, room_id={self.room_id}, toxic={self.is_toxic})>"
 
@@ -59,7 +86,10 @@ class UserRoom(Base):
     user = relationship("User", back_populates="user_rooms")
     room = relationship("ChatRoom", back_populates="members")
 
-    __table_args__ = (UniqueConstraint("user_id", "room_id", name="unique_user_room"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "room_id", name="unique_user_room"),
+        Index("ix_user_rooms_room_id", "room_id"),
+    )
 
     def __repr__(self):
         return f"<UserRoom(user_id={self.user_id}, room_id={self.room_id})>"
@@ -75,7 +105,10 @@ class RoomUserSetting(Base):
     user = relationship("User", back_populates="room_settings")
     room = relationship("ChatRoom", back_populates="room_settings")
 
-    __table_args__ = (UniqueConstraint("user_id", "room_id", name="unique_user_setting"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "room_id", name="unique_user_setting"),
+        Index("ix_room_user_settings_room_id", "room_id"),
+    )
 
     def __repr__(self):
         return (
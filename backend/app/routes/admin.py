@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, Query
+from app.core.loop_monitor import loop_monitor
+from app.database.profiling import profiler
+from app.models.models import User
+from app.services import auth_cache
+from app.services.message_writer import message_writer
+from app.services.password_hasher import password_hasher
+from app.services.rate_limit import ws_admission, ws_limiter
+from app.services.room_directory import room_directory
+from app.services.websocket_manager import manager
+from app.utils.common import get_admin_user
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.get("/stats/messages")
+def message_writer_stats(current_user: User = Depends(get_admin_user)):
+    return message_writer.stats()
+
+@router.get("/stats/auth")
+def auth_cache_stats(current_user: User = Depends(get_admin_user)):
+    return auth_cache.stats()
+
+@router.get("/stats/passwords")
+def password_hasher_stats(current_user: User = Depends(get_admin_user)):
+    return password_hasher.stats()
+
+@router.get("/stats/rooms")
+def room_directory_stats(current_user: User = Depends(get_admin_user)):
+    return room_directory.stats()
+
+@router.get("/stats/websockets")
+def websocket_stats(current_user: User = Depends(get_admin_user)):
+    return {**manager.stats(), "admission": ws_admission.stats(), "rate_limits": ws_limiter.stats()}
+
+@router.get("/db")
+def database_stats(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_admin_user),
+):
+    return profiler.snapshot(limit)
+
+@router.post("/db/reset")
+def reset_database_stats(current_user: User = Depends(get_admin_user)):
+    profiler.reset()
+    return {"status": "reset"}
+
+@router.get("/loop")
+def event_loop_stats(
+    limit: int = Query(20, ge=0, le=200),
+    current_user: User = Depends(get_admin_user),
+):
+    return loop_monitor.stats(limit)
+
+@router.post("/loop/reset")
+def reset_event_loop_stats(current_user: User = Depends(get_admin_user)):
+    loop_monitor.reset()
+    return {"status": "reset"}
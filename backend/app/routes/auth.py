@@ -1,13 +1,17 @@
+import logging
 import os
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from jose import jwt
-from passlib.context import CryptContext
 from dotenv import load_dotenv
-from app.database.database import get_db
+from app.database.executor import run_db
 from app.models.models import User
+from app.services.password_hasher import HasherBusy, password_hasher
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -15,19 +19,29 @@ SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 1440))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        return pwd_context.verify(plain, hashed)
-    except Exception as e:
-        print("verify_password error:", e)
-        return False
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+def _find_user(db: Session, username: str):
+    return db.query(User).filter_by(username=username).first()
+
+def _create_user(db: Session, username: str, hashed: str) -> User:
+    user = User(username=username, hashed_password=hashed)
+    db.add(user)
+    db.commit()
+    return user
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def _update_password_hash(db: Session, user_id: int, hashed: str):
+    user = db.get(User, user_id)
+    if user:
+        user.hashed_password = hashed
+        db.commit()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -36,37 +50,47 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 @router.post("/register")
-def register(username: str, password: str, db: Session = Depends(get_db)):
+async def register(username: str, password: str):
     if not username or not password:
         raise HTTPException(status_code=400, detail="username and password required")
 
-    existing = db.query(User).filter_by(username=username).first()
+    existing = await run_db(_find_user, username)
     if existing:
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    hashed = get_password_hash(password)
-    user = User(username=username, hashed_password=hashed)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    print(f"User registered: id={user.id} username={user.username}")
+    try:
+        hashed = await password_hasher.hash(password)
+    except HasherBusy:
+        raise _busy()
+    try:
+        user = await run_db(_create_user, username, hashed)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Username already taken")
+    logger.info("User registered: id=%s username=%s", user.id, user.username)
     return {"message": "User registered successfully", "id": user.id, "username": user.username}
 
 @router.post("/login")
-def login(username: str, password: str, db: Session = Depends(get_db)):
+async def login(username: str, password: str):
     if not username or not password:
         raise HTTPException(status_code=400, detail="username and password required")
 
-    user = db.query(User).filter_by(username=username).first()
+    user = await run_db(_find_user, username)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
 
-    if not verify_password(password, user.hashed_password):
+    try:
+        ok, new_hash = await password_hasher.verify(password, user.hashed_password)
+    except HasherBusy:
+        raise _busy()
+    if not ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    if new_hash:
+        # Stored with a different BCRYPT_ROUNDS; upgrade it now that we know the password.
+        await run_db(_update_password_hash, user.id, new_hash)
 
     token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     token_payload = {"sub": user.username, "uid": str(user.id)}
     token = create_access_token(token_payload, expires_delta=token_expires)
 
-    print(f"User login: id={user.id}, username={user.username}")
+    logger.info("User login: id=%s, username=%s", user.id, user.username)
     return {"access_token": token, "token_type": "bearer"}
@@ -1,14 +1,38 @@
+import asyncio
 import json
+import logging
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Header, Query, HTTPException
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from app.database.database import get_db, SessionLocal
-from app.models.models import Message, User, ChatRoom
-from app.services.encryption import decrypt_message
-from app.services.toxicity import predict_toxicity, clean_text
+from app.core.config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, WS_INBOUND_QUEUE_SIZE, WS_RATE_LIMIT_STRIKES
+from app.database.database import get_db
+from app.database.executor import run_db
+from app.models.models import Message, User
+from app.services.encryption import decrypt_message, decrypt_many
+from app.services.room_cache import get_cached_room
+from app.services.inference import toxicity_batcher
+from app.services.message_writer import message_writer
+from app.services.rate_limit import (
+    INBOUND_DROPPED,
+    POLICY_VIOLATION_CLOSE_CODE,
+    TRY_AGAIN_LATER_CLOSE_CODE,
+    close_for_policy,
+    ws_admission,
+    ws_limiter,
+)
+from app.services.toxicity import clean_text
 from app.services.websocket_manager import manager
-from app.utils.common import get_user_from_token, get_or_create_chatroom, get_or_create_room_user_setting
+from app.utils.common import (
+    get_user_from_token,
+    get_chatroom,
+    get_or_create_chatroom,
+    get_or_create_room_user_setting,
+    get_room_filter_enabled,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -23,10 +47,7 @@ def get_chat_key(chat_id: str, authorization: Optional[str] = Header(None), db:
             token = parts[1]
             user = get_user_from_token(token, db)
             if user:
-                setting = db.query(ChatRoom.room_settings.property.mapper.class_).filter_by(
-                    user_id=user.id, room_id=room.id
-                ).first()
-                user_pref = bool(setting.filter_enabled) if setting else False
+                user_pref = get_room_filter_enabled(db, user.id, room.id)
 
     return {
         "chat_id": chat_id,
@@ -34,8 +55,14 @@ def get_chat_key(chat_id: str, authorization: Optional[str] = Header(None), db:
         "user_filter": user_pref,
     }
 
+def _save_room_filter(db: Session, user_id: int, room_id: int, enabled: bool) -> bool:
+    setting = get_or_create_room_user_setting(db, user_id, room_id)
+    setting.filter_enabled = bool(enabled)
+    db.commit()
+    return setting.filter_enabled
+
 @router.post("/{chat_id}/filter")
-def set_room_filter(chat_id: str, enabled: bool, authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+async def set_room_filter(chat_id: str, enabled: bool, authorization: Optional[str] = Header(None)):
 
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
@@ -45,24 +72,34 @@ def set_room_filter(chat_id: str, enabled: bool, authorization: Optional[str] =
         raise HTTPException(status_code=401, detail="Invalid Authorization format")
 
     token = parts[1]
-    user = get_user_from_token(token, db)
+    user = await run_db(lambda db: get_user_from_token(token, db))
     if not user:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    room = db.query(ChatRoom).filter_by(name=chat_id).first()
+    room = await run_db(get_chatroom, chat_id)
     if not room:
         raise HTTPException(status_code=404, detail="Chat room not found")
 
-    setting = get_or_create_room_user_setting(db, user.id, room.id)
-    setting.filter_enabled = bool(enabled)
-    db.commit()
+    filter_enabled = await run_db(_save_room_filter, user.id, room.id, enabled)
+    # On the event loop: the manager's room state is not thread-safe, and the
+    # change is published to the user's sockets on other workers too.
+    await manager.set_user_filter(chat_id, user.id, filter_enabled)
 
-    return {"chat_id": chat_id, "filter_enabled": setting.filter_enabled}
+    return {"chat_id": chat_id, "filter_enabled": filter_enabled}
 
 @router.get("/{chat_id}/history")
-def get_chat_history(chat_id: str, authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
-
-    room = db.query(ChatRoom).filter_by(name=chat_id).first()
+def get_chat_history(
+    chat_id: str,
+    before_id: Optional[int] = Query(None),
+    after_id: Optional[int] = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+
+    room = get_chatroom(db, chat_id)
     if not room:
         raise HTTPException(status_code=404, detail="Chat room not found")
 
@@ -73,34 +110,63 @@ def get_chat_history(chat_id: str, authorization: Optional[str] = Header(None),
             token = parts[1]
             user = get_user_from_token(token, db)
             if user:
-                setting = db.query(ChatRoom.room_settings.property.mapper.class_).filter_by(
-                    user_id=user.id, room_id=room.id
-                ).first()
-                filter_enabled = bool(setting.filter_enabled) if setting else False
-
-    query = db.query(Message).filter_by(room_id=room.id).order_by(Message.timestamp.asc())
+                filter_enabled = get_room_filter_enabled(db, user.id, room.id)
+
+    # Keyset scan over (room_id, timestamp, id): the newest page by default,
+    # older pages with before_id and newer ones with after_id. Ids come from
+    # per-worker blocks, so the cursor message's timestamp orders the page and
+    # its id only breaks ties. One extra row tells us whether there is more in
+    # that direction.
+    cursor_id = after_id if after_id is not None else before_id
+    cursor = None
+    if cursor_id is not None:
+        cursor_ts = (
+            db.query(Message.timestamp)
+            .filter(Message.id == cursor_id, Message.room_id == room.id)
+            .scalar()
+        )
+        if cursor_ts is None:
+            raise HTTPException(status_code=400, detail="Cursor is not a message in this room")
+        cursor = (cursor_ts, cursor_id)
+
+    key = tuple_(Message.timestamp, Message.id)
+    query = (
+        db.query(Message, User.username)
+        .outerjoin(User, User.id == Message.sender_id)
+        .filter(Message.room_id == room.id)
+    )
     if filter_enabled:
         query = query.filter(Message.is_toxic == False)
 
-    messages = query.all()
+    if after_id is not None:
+        query = query.filter(key > cursor).order_by(Message.timestamp.asc(), Message.id.asc())
+    else:
+        if before_id is not None:
+            query = query.filter(key < cursor)
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is None:
+        rows.reverse()
+
+    decrypted = decrypt_many(room.symmetric_key, [msg.ciphertext for msg, _ in rows])
     history = []
 
-    for msg in messages:
-        try:
-            plaintext = decrypt_message(room.symmetric_key, msg.ciphertext)
-        except Exception:
+    for (msg, sender_name), (plaintext, error) in zip(rows, decrypted):
+        if error is not None:
             plaintext = "[decryption_error]"
 
-        sender = db.query(User).get(msg.sender_id)
-
         history.append({
             "id": msg.id,
-            "from": sender.username if sender else "unknown",
+            "from": sender_name or "unknown",
             "sender_id": msg.sender_id,       
             "text": plaintext,
             "ciphertext": msg.ciphertext,    
             "toxic": bool(msg.is_toxic),
             "prob": float(msg.toxicity_prob),
+            "model_version": msg.model_version,
             "timestamp": msg.timestamp.isoformat(),
         })
 
@@ -108,55 +174,94 @@ def get_chat_history(chat_id: str, authorization: Optional[str] = Header(None),
         "chat_id": chat_id,
         "messages": history,
         "filter_enabled": filter_enabled,
+        "has_more": has_more,
+        "next_before_id": history[0]["id"] if history else before_id,
+        "next_after_id": history[-1]["id"] if history else after_id,
     }
 
+async def _read_frames(websocket: WebSocket, conn, inbound: asyncio.Queue):
+    # Reads ahead of the handler so limits apply as frames arrive, not after
+    # the previous message's inference and commit. The queue is bounded here
+    # rather than by maxsize, so the end-of-stream None always fits.
+    strikes = 0
+    try:
+        while True:
+            payload = json.loads(await websocket.receive_text())
+            kind = "typing" if payload.get("event") == "typing" else "message"
+
+            limited = ws_limiter.check(kind, conn.conn_id, conn.user_id, conn.room_name)
+            if limited is not None:
+                if kind == "typing":
+                    continue
+                scope, retry_after = limited
+                # A busy room is not this client's fault; only its own
+                # connection or user budget running out counts against it.
+                if scope != "room":
+                    strikes += 1
+                    if WS_RATE_LIMIT_STRIKES and strikes >= WS_RATE_LIMIT_STRIKES:
+                        await close_for_policy(websocket, POLICY_VIOLATION_CLOSE_CODE, "rate_limited")
+                        return
+                manager.send(conn, json.dumps({"type": "rate_limited", "scope": scope, "retry_after": round(retry_after, 3)}))
+                continue
+            if kind == "message":
+                strikes = 0
+
+            if inbound.qsize() >= WS_INBOUND_QUEUE_SIZE:
+                if kind == "typing":
+                    INBOUND_DROPPED.inc()
+                    continue
+                await close_for_policy(websocket, TRY_AGAIN_LATER_CLOSE_CODE, "overloaded")
+                return
+            inbound.put_nowait(payload)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        inbound.put_nowait(None)
+
 @router.websocket("/ws/{chat_id}")
 async def websocket_endpoint(websocket: WebSocket, chat_id: str):
 
+    if not ws_admission.try_acquire():
+        await websocket.accept()
+        await close_for_policy(websocket, TRY_AGAIN_LATER_CLOSE_CODE, "server_busy")
+        return
+    try:
+        await _serve_socket(websocket, chat_id)
+    finally:
+        ws_admission.release()
+
+async def _serve_socket(websocket: WebSocket, chat_id: str):
+
     token = websocket.query_params.get("token")
     if not token:
         await websocket.close(code=1008)
         return
 
-    db = SessionLocal()
-    user = get_user_from_token(token, db)
+    user = await run_db(lambda db: get_user_from_token(token, db))
     if not user:
         await websocket.close(code=1008)
-        db.close()
         return
 
     username = user.username
-    room = get_or_create_chatroom(db, chat_id)
+    room = get_cached_room(chat_id) or await run_db(get_or_create_chatroom, chat_id)
     key = room.symmetric_key
 
-    setting = db.query(ChatRoom.room_settings.property.mapper.class_).filter_by(
-        user_id=user.id, room_id=room.id
-    ).first()
-    filter_enabled = bool(setting.filter_enabled) if setting else False
+    filter_enabled = await run_db(get_room_filter_enabled, user.id, room.id)
 
     await websocket.accept()
-    await manager.connect(chat_id, websocket, user.id, username, filter_enabled)
+    conn = await manager.connect(chat_id, websocket, user.id, username, filter_enabled)
     await manager.broadcast_presence(chat_id, username, "online")
 
+    inbound: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.create_task(_read_frames(websocket, conn, inbound))
     try:
         while True:
-            data = await websocket.receive_text()
-            payload = json.loads(data)
+            payload = await inbound.get()
+            if payload is None:
+                break
 
             if payload.get("event") == "typing":
-                conns = manager.active.get(chat_id, [])
-                for c in conns:
-                    if c["ws"] != websocket:
-                        try:
-                            await c["ws"].send_text(
-                                json.dumps({
-                                    "event": "typing",
-                                    "from": username,
-                                    "is_typing": payload.get("is_typing", False),
-                                })
-                            )
-                        except Exception:
-                            pass
+                manager.set_typing(conn, bool(payload.get("is_typing", False)))
                 continue
 
             cipher = payload.get("ciphertext")
@@ -169,7 +274,7 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: str):
                 plaintext = None
 
             cleaned = clean_text(plaintext or "")
-            pred, prob = predict_toxicity(cleaned)
+            pred, prob, model_version = await toxicity_batcher.predict(cleaned)
             is_toxic = bool(pred) and (prob and prob > 0.0)
 
             msg = Message(
@@ -178,16 +283,25 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: str):
                 ciphertext=cipher,
                 is_toxic=is_toxic,
                 toxicity_prob=prob or 0.0,
+                model_version=model_version,
                 timestamp=datetime.utcnow(),
             )
-            db.add(msg)
-            db.commit()
-            db.refresh(msg)
+            try:
+                msg = await message_writer.submit(msg)
+            except Exception as e:
+                # Only this message is lost; the session carries on.
+                logger.warning("Message from user %s in %s was not saved: %s", user.id, chat_id, e)
+                manager.send(conn, json.dumps({"type": "message_failed", "error": "Message could not be saved"}))
+                continue
 
-            await manager.broadcast_message(chat_id, msg, plaintext or "")
+            await manager.broadcast_message(chat_id, msg, plaintext or "", sender_username=username)
+            manager.clear_typing(conn)
 
-    except WebSocketDisconnect:
-        manager.disconnect(chat_id, websocket)
+        # Surfaces a read error (e.g. a malformed frame) as before.
+        await reader
+        manager.disconnect(conn)
         await manager.broadcast_presence(chat_id, username, "offline")
     finally:
-        db.close()
+        reader.cancel()
+        ws_limiter.release(conn.conn_id)
+        manager.disconnect(conn)
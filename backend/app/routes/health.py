@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core import startup
+from app.core.config import TOXICITY_WARMUP
+from app.services import toxicity
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+@router.get("")
+def health():
+    return {"status": "ok"}
+
+@router.get("/ready")
+def readiness():
+    # Ready once the database is initialised and the warm-up (if enabled) has
+    # settled; a missing model is reported but does not hold traffic back.
+    db_ready = startup.is_done("db_ready")
+    model_settled = not TOXICITY_WARMUP or toxicity.model_state() in ("loaded", "failed")
+    ready = db_ready and model_settled
+    body = {
+        "ready": ready,
+        "db_ready": db_ready,
+        "model_loaded": toxicity.is_model_loaded(),
+        "model_state": toxicity.model_state(),
+        "model_version": toxicity.model_version(),
+        "startup_ms": startup.timings,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
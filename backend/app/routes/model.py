@@ -1,90 +1,128 @@
+import csv
+import logging
 import os
-import joblib
-import pandas as pd
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-from app.database.database import get_db
-from app.models.models import Message
-from app.services.toxicity import clean_text
+import shutil
+import tempfile
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from app.core.config import RETRAIN_YIELD_PER
+from app.models.models import User
+from app.services import toxicity
+from app.services.jobs import job_runner
+from app.services.model_registry import REGISTRY_DIR, registry
+from app.services.retrain import retrain
+from app.services.toxicity_cache import toxicity_cache
+from app.utils.common import get_admin_user
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/model", tags=["Model"])
 
-MODEL_DIR = os.path.join(os.path.dirname(__file__), "../models")
-VECT_PATH = os.path.abspath(os.path.join(MODEL_DIR, "vectorizer.pkl"))
-MODEL_PATH = os.path.abspath(os.path.join(MODEL_DIR, "model.pkl"))
 
 @router.get("/status")
 def model_status():
-    exists = os.path.exists(MODEL_PATH) and os.path.exists(VECT_PATH)
-    size = (
-        os.path.getsize(MODEL_PATH) + os.path.getsize(VECT_PATH)
-        if exists
-        else 0
-    )
     return {
-        "model_loaded": exists,
-        "model_size_kb": round(size / 1024, 2),
-        "model_dir": MODEL_DIR,
+        "model_loaded": toxicity.is_model_loaded(),
+        "model_version": toxicity.model_version(),
+        "model_dir": REGISTRY_DIR,
     }
 
-@router.post("/retrain")
-async def retrain_model(
-    db: Session = Depends(get_db),
-    file: UploadFile = File(None)
+@router.get("/cache")
+def model_cache_stats():
+    return {"model_version": toxicity.model_version(), **toxicity_cache.stats()}
+
+@router.get("/versions")
+def list_versions():
+    active = toxicity.model_version()
+    return [{**m, "active": m["version"] == active} for m in registry.versions()]
+
+async def _registry_call(fn, *args):
+    # Loading a version takes seconds; it happens on a worker thread while
+    # traffic keeps using the current model.
+    try:
+        return await run_in_threadpool(fn, *args)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load model: {e}")
+
+@router.post("/versions/{version}/activate")
+async def activate_version(version: str, current_user: User = Depends(get_admin_user)):
+    await _registry_call(registry.activate, version)
+    logger.info("Activated model version %s (by %s)", version, current_user.username)
+    return registry.stats()
+
+@router.post("/rollback")
+async def rollback_version(current_user: User = Depends(get_admin_user)):
+    version = await _registry_call(registry.rollback)
+    logger.info("Rolled back to model version %s (by %s)", version, current_user.username)
+    return registry.stats()
+
+@router.get("/shadow")
+def shadow_status():
+    return registry.stats()["shadow"]
+
+@router.post("/versions/{version}/shadow")
+async def shadow_version(
+    version: str,
+    rate: float = Query(0.1, gt=0, le=1),
+    current_user: User = Depends(get_admin_user),
 ):
+    # Scores a sample of live traffic with the candidate and compares it with
+    # the active model; nothing it produces reaches users.
+    await _registry_call(registry.set_shadow, version, rate)
+    return registry.stats()["shadow"]
 
-    print("Starting model retraining...")
-
-    if file:
-        try:
-            df = pd.read_csv(file.file)
-            if "text" not in df.columns or "label" not in df.columns:
-                raise HTTPException(
-                    status_code=400,
-                    detail="CSV must contain 'text' and 'label' columns",
-                )
-            print(f"Loaded dataset from upload: {df.shape[0]} samples")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to read CSV: {e}")
-    else:
-        messages = db.query(Message).all()
-        if not messages:
-            raise HTTPException(status_code=400, detail="No messages available for retraining")
-        df = pd.DataFrame(
-            [{"text": clean_text(m.ciphertext), "label": int(m.is_toxic)} for m in messages]
-        )
-        print(f"Loaded {len(df)} messages from database for retraining")
-
-    df["text"] = df["text"].astype(str).apply(clean_text)
-
-    X_train, X_test, y_train, y_test = train_test_split(
-        df["text"], df["label"], test_size=0.2, random_state=42
-    )
-
-    vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
-    X_train_vec = vectorizer.fit_transform(X_train)
-    X_test_vec = vectorizer.transform(X_test)
-
-    model = LogisticRegression(max_iter=200)
-    model.fit(X_train_vec, y_train)
-
-    y_pred = model.predict(X_test_vec)
-    acc = accuracy_score(y_test, y_pred)
-    print(f"Retrained model accuracy: {acc:.4f}")
-
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    joblib.dump(vectorizer, VECT_PATH)
-    joblib.dump(model, MODEL_PATH)
-    print(f"Saved updated model + vectorizer to {MODEL_DIR}")
+@router.delete("/shadow")
+async def clear_shadow(current_user: User = Depends(get_admin_user)):
+    await _registry_call(registry.set_shadow, None)
+    return registry.stats()["shadow"]
 
-    return {
-        "message": "Model retrained successfully",
-        "samples": len(df),
-        "accuracy": round(acc, 4),
-        "model_path": MODEL_PATH,
-        "vectorizer_path": VECT_PATH,
-    }
+def _save_upload(file: UploadFile) -> str:
+    # The job runs in another process, so the upload is spooled to disk. The
+    # header is checked here to reject a bad CSV before a job is created.
+    header = file.file.readline().decode("utf-8-sig", errors="replace")
+    columns = {c.strip().strip('"') for c in next(csv.reader([header]), [])}
+    if "text" not in columns or "label" not in columns:
+        raise HTTPException(status_code=400, detail="CSV must contain 'text' and 'label' columns")
+    fd, path = tempfile.mkstemp(prefix="retrain-", suffix=".csv")
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        out.write(header)
+    with open(path, "ab") as out:
+        shutil.copyfileobj(file.file, out)
+    return path
+
+def _remove_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+@router.post("/retrain", status_code=202)
+async def retrain_model(file: UploadFile = File(None), current_user: User = Depends(get_admin_user)):
+    # Training runs as a background job; poll GET /model/jobs/{job_id}.
+    csv_path = await run_in_threadpool(_save_upload, file) if file else None
+    cleanup = (lambda: _remove_file(csv_path)) if csv_path else None
+    job = job_runner.submit("retrain", retrain, cleanup=cleanup, csv_path=csv_path, yield_per=RETRAIN_YIELD_PER)
+    logger.info("Queued model retraining job %s", job.id)
+    return {"job_id": job.id, "status": job.state, "status_url": f"/model/jobs/{job.id}"}
+
+@router.get("/jobs")
+def list_jobs():
+    return job_runner.list_jobs()
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = job_runner.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
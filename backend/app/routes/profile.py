@@ -24,8 +24,15 @@ def update_profile(
         if existing:
             raise HTTPException(status_code=400, detail="Username already taken")
 
-        current_user.username = username
+        # current_user may be a detached copy from the auth cache; update the
+        # row through this session so the change is flushed and the cache
+        # entry invalidated.
+        user = db.get(User, current_user.id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user.username = username
         db.commit()
-        db.refresh(current_user)
+        db.refresh(user)
+        current_user = user
 
     return {"message": "Profile updated", "username": current_user.username}
@@ -2,19 +2,29 @@ import base64
 import os
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+from typing import Optional
+from app.core.config import ROOM_PAGE_SIZE, ROOM_MAX_PAGE_SIZE
 from app.database.database import get_db
 from app.models.models import ChatRoom, UserRoom
-from app.utils.common import get_current_user
+from app.services.room_cache import cache_room
+from app.services.room_directory import InvalidCursor, room_directory
+from app.utils.common import get_current_user, upsert_chatroom
 
 router = APIRouter(prefix="/rooms", tags=["Rooms"])
 
 @router.get("")
-def list_rooms(search: str = Query(None), db: Session = Depends(get_db)):
-    query = db.query(ChatRoom)
-    if search:
-        query = query.filter(ChatRoom.name.ilike(f"%{search}%"))
-    rooms = query.all()
-    return [{"id": r.id, "name": r.name} for r in rooms]
+def list_rooms(
+    search: str = Query(None),
+    limit: int = Query(ROOM_PAGE_SIZE, ge=1, le=ROOM_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    # Exact name matches first, then prefix, then substring; more members
+    # ranks higher within each. Pass next_cursor back to get the next page.
+    try:
+        return room_directory.search(db, search, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("")
 def create_room(
@@ -22,15 +32,11 @@ def create_room(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    existing = db.query(ChatRoom).filter_by(name=name).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Room already exists")
-
     key = base64.b64encode(os.urandom(32)).decode()
-    room = ChatRoom(name=name, symmetric_key=key)
-    db.add(room)
-    db.commit()
-    db.refresh(room)
+    room = upsert_chatroom(db, name, key, update_missing_key=False)
+    if room is None:
+        raise HTTPException(status_code=400, detail="Room already exists")
+    cache_room(room)
 
     link = UserRoom(user_id=current_user.id, room_id=room.id)
     db.add(link)
@@ -43,9 +49,10 @@ def join_room(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    room = db.query(ChatRoom).get(room_id)
+    room = db.get(ChatRoom, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
+    cache_room(room)
 
     existing = db.query(UserRoom).filter_by(user_id=current_user.id, room_id=room_id).first()
     if existing:
@@ -0,0 +1,37 @@
+import hashlib
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from app.core.config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL
+from app.models.models import User
+from app.utils.ttl_cache import TTLCache
+
+# Verified claims keyed by sha256 of the raw token, so tokens are not kept in
+# memory; and user rows keyed by id, stored as plain column values.
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def get_cached_user(uid: int) -> Optional[User]:
+    values = user_cache.get(uid)
+    if values is None:
+        return None
+    # A fresh detached instance per hit: callers may not share or mutate it,
+    # and anything that writes to the user must load it in its own session.
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+def cache_user(user: User, expires_at: Optional[float], generation: int):
+    values = {"id": user.id, "username": user.username, "hashed_password": user.hashed_password}
+    user_cache.put(user.id, values, expires_at, generation)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+def stats() -> Dict[str, Any]:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+from typing import List, Optional
+from app.core.config import TOXICITY_ONNX_THREADS
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8)
+
+# Exports live next to the SentenceTransformer files they were made from.
+ONNX_DIR = "onnx"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model-int8.onnx"
+
+class TorchEncoder:
+    # The reference: SentenceTransformer on full-precision PyTorch.
+
+    backend = BACKEND_TORCH
+
+    def __init__(self, path: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(path, device="cpu")
+
+    def encode(self, texts: List[str]):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True)
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _pooling_mode(path: str) -> str:
+    # The pooling SentenceTransformer applies after the transformer, from its
+    # modules.json; only the modes the ONNX path reproduces are accepted.
+    for module in _read_json(os.path.join(path, "modules.json")) or []:
+        if module.get("type", "").endswith("Pooling"):
+            config = _read_json(os.path.join(path, module.get("path", ""), "config.json"))
+            if config.get("pooling_mode_cls_token"):
+                return "cls"
+            if config.get("pooling_mode_mean_tokens", True):
+                return "mean"
+            raise ValueError(f"Unsupported pooling in {path}: {config}")
+    return "mean"
+
+def _max_seq_length(path: str) -> Optional[int]:
+    return _read_json(os.path.join(path, "sentence_bert_config.json")).get("max_seq_length")
+
+def export_onnx(path: str, quantize: bool = True) -> str:
+    # Transformer body to ONNX with dynamic batch and sequence axes, then
+    # (optionally) dynamic int8 quantization of the weights. Pooling and
+    # normalization stay in numpy, see OnnxEncoder.encode.
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = os.path.join(path, ONNX_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, ONNX_FILE)
+
+    if not os.path.exists(fp32_path):
+        tokenizer = AutoTokenizer.from_pretrained(path)
+        model = AutoModel.from_pretrained(path).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        axes = {n: {0: "batch", 1: "sequence"} for n in names}
+        axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=".onnx.tmp")
+        os.close(fd)
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    ({n: sample[n] for n in names},),
+                    tmp,
+                    input_names=names,
+                    output_names=["last_hidden_state"],
+                    dynamic_axes=axes,
+                    opset_version=14,
+                    do_constant_folding=True,
+                )
+            os.replace(tmp, fp32_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        logger.info("Exported %s to %s", path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = os.path.join(out_dir, ONNX_INT8_FILE)
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=".onnx.tmp")
+        os.close(fd)
+        try:
+            quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+            os.replace(tmp, int8_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        logger.info("Quantized %s to %s", fp32_path, int8_path)
+    return int8_path
+
+class OnnxEncoder:
+    # The same encoder on ONNX Runtime. Produces the embeddings TorchEncoder
+    # does (mean or CLS pooling, L2-normalized) up to numerical drift, which
+    # benchmarks/bench_encoder.py measures against the reference.
+
+    def __init__(self, path: str, quantized: bool = True, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.backend = BACKEND_ONNX_INT8 if quantized else BACKEND_ONNX
+        model_path = os.path.join(path, ONNX_DIR, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(model_path):
+            model_path = export_onnx(path, quantize=quantized)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_length = _max_seq_length(path)
+        self.pooling = _pooling_mode(path)
+
+    def encode(self, texts: List[str]):
+        import numpy as np
+
+        batch = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        feeds = {name: value.astype(np.int64) for name, value in batch.items() if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            emb = hidden[:, 0]
+        else:
+            mask = batch["attention_mask"][..., None].astype(hidden.dtype)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        return emb / np.clip(norms, 1e-12, None)
+
+def load_encoder(path: str, backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
+    if backend == BACKEND_TORCH:
+        return TorchEncoder(path)
+    try:
+        return OnnxEncoder(path, quantized=backend == BACKEND_ONNX_INT8, threads=TOXICITY_ONNX_THREADS)
+    except Exception as e:
+        # A missing runtime or a failed export should not take scoring down.
+        logger.warning("ONNX encoder unavailable for %s, falling back to %s: %s", path, BACKEND_TORCH, e)
+        return TorchEncoder(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformer encoder to ONNX")
+    parser.add_argument("path", nargs="?", help="encoder directory (default: the legacy sbert_encoder)")
+    parser.add_argument("--no-quantize", action="store_true", help="stop after the fp32 export")
+    args = parser.parse_args()
+
+    from app.services.model_registry import ENC_DIR
+
+    print(export_onnx(args.path or ENC_DIR, quantize=not args.no_quantize))
+
+if __name__ == "__main__":
+    main()
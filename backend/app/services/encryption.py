@@ -1,7 +1,27 @@
 import base64
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from Crypto.Random import get_random_bytes
+from app.core.config import ENCRYPTION_WORKERS, ENCRYPTION_CHUNK_SIZE, ENCRYPTION_KEY_CACHE_SIZE
+from app.core.metrics import FAST_BUCKETS, registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# Per call; encrypt_many/decrypt_many cover their whole list.
+CRYPTO_SECONDS = metrics.histogram("encryption_duration_seconds", "AES time per call", ("op",), buckets=FAST_BUCKETS)
+CRYPTO_FAILURES = metrics.counter("encryption_failures_total", "Items that failed to encrypt or decrypt", ("op",))
+
+# (result, error) per item: exactly one of the two is None.
+BulkResult = Tuple[Optional[str], Optional[str]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
 
 def get_aes_key(base64_key: str) -> bytes:
     try:
@@ -10,26 +30,95 @@ def get_aes_key(base64_key: str) -> bytes:
     except Exception as e:
         raise ValueError(f"Invalid AES key: {e}")
 
+# Room keys are decoded once. The cache is keyed on the encoded key itself, so
+# a room whose key changes simply misses and the stale entry ages out.
+@lru_cache(maxsize=ENCRYPTION_KEY_CACHE_SIZE)
+def _decode_key(base64_key: str) -> bytes:
+    return base64.b64decode(base64_key)
+
+def clear_key_cache():
+    _decode_key.cache_clear()
+
+def _encrypt(key: bytes, plaintext: str) -> str:
+    iv = get_random_bytes(16)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    ciphertext = cipher.encrypt(pad(plaintext.encode("utf-8"), AES.block_size))
+    return base64.b64encode(iv + ciphertext).decode()
+
+def _decrypt(key: bytes, b64_cipher: str) -> str:
+    raw = base64.b64decode(b64_cipher)
+    iv = raw[:16]
+    ciphertext = raw[16:]
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
+    return decrypted.decode("utf-8")
+
 def encrypt_message(base64_key: str, plaintext: str) -> str:
+    start = time.perf_counter()
     try:
-        key = base64.b64decode(base64_key)
-        iv = get_random_bytes(16)
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        ciphertext = cipher.encrypt(pad(plaintext.encode("utf-8"), AES.block_size))
-        return base64.b64encode(iv + ciphertext).decode()
+        return _encrypt(_decode_key(base64_key), plaintext)
     except Exception as e:
-        print("Encryption failed:", e)
+        CRYPTO_FAILURES.labels("encrypt").inc()
+        logger.warning("Encryption failed: %s", e)
         raise e
+    finally:
+        CRYPTO_SECONDS.labels("encrypt").observe(time.perf_counter() - start)
 
 def decrypt_message(base64_key: str, b64_cipher: str) -> str:
+    start = time.perf_counter()
     try:
-        key = base64.b64decode(base64_key)
-        raw = base64.b64decode(b64_cipher)
-        iv = raw[:16]
-        ciphertext = raw[16:]
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
-        return decrypted.decode("utf-8")
+        return _decrypt(_decode_key(base64_key), b64_cipher)
     except Exception as e:
-        print("Decryption failed:", e)
+        CRYPTO_FAILURES.labels("decrypt").inc()
+        logger.warning("Decryption failed: %s", e)
         raise e
+    finally:
+        CRYPTO_SECONDS.labels("decrypt").observe(time.perf_counter() - start)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ENCRYPTION_WORKERS, thread_name_prefix="crypto")
+    return _executor
+
+def _run_chunk(fn, key: bytes, items: Sequence[str]) -> List[BulkResult]:
+    out = []
+    for item in items:
+        try:
+            out.append((fn(key, item), None))
+        except Exception as e:
+            out.append((None, str(e) or type(e).__name__))
+    return out
+
+def _run_bulk(fn, base64_key: str, items: Sequence[str], chunk_size: int) -> List[BulkResult]:
+    try:
+        key = _decode_key(base64_key)
+    except Exception as e:
+        return [(None, f"Invalid AES key: {e}")] * len(items)
+
+    chunk_size = max(1, chunk_size)
+    if len(items) <= chunk_size or ENCRYPTION_WORKERS <= 1:
+        return _run_chunk(fn, key, items)
+
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results: List[BulkResult] = []
+    for part in _get_executor().map(lambda chunk: _run_chunk(fn, key, chunk), chunks):
+        results.extend(part)
+    return results
+
+def _timed_bulk(op: str, fn, base64_key: str, items: Sequence[str], chunk_size: int) -> List[BulkResult]:
+    start = time.perf_counter()
+    results = _run_bulk(fn, base64_key, items, chunk_size)
+    CRYPTO_SECONDS.labels(op).observe(time.perf_counter() - start)
+    failures = sum(1 for _, error in results if error is not None)
+    if failures:
+        CRYPTO_FAILURES.labels(op).inc(failures)
+    return results
+
+def encrypt_many(base64_key: str, plaintexts: Sequence[str], chunk_size: int = ENCRYPTION_CHUNK_SIZE) -> List[BulkResult]:
+    return _timed_bulk("encrypt_many", _encrypt, base64_key, plaintexts, chunk_size)
+
+def decrypt_many(base64_key: str, ciphertexts: Sequence[str], chunk_size: int = ENCRYPTION_CHUNK_SIZE) -> List[BulkResult]:
+    return _timed_bulk("decrypt_many", _decrypt, base64_key, ciphertexts, chunk_size)
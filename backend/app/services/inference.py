@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from app.core.config import TOXICITY_BATCH_SIZE, TOXICITY_BATCH_WAIT_MS, TOXICITY_WORKERS
+from app.services.toxicity import predict_toxicity_batch
+
+class ToxicityBatcher:
+    # Texts from every room are scored together off the event loop. While all
+    # workers are busy new texts keep queueing, so batches grow instead of calls.
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float, workers: int):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._pending: set = set()
+
+    def start(self):
+        if self._collector and not self._collector.done():
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="toxicity")
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        if self._collector:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def predict(self, text: str) -> Tuple[int, float, Optional[str]]:
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # asyncio.wait rather than wait_for: on 3.10/3.11 wait_for can
+                # swallow a cancel that lands together with its timeout.
+                getter = asyncio.ensure_future(self._queue.get())
+                try:
+                    done, _ = await asyncio.wait({getter}, timeout=timeout)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if not done:
+                    break
+                batch.append(getter.result())
+
+            await self._slots.acquire()
+
+            # Whatever arrived while every worker was busy rides along.
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = loop.create_task(self._score(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _score(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            live = [(text, fut) for text, fut in batch if not fut.done()]
+            if not live:
+                return
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, predict_toxicity_batch, [text for text, _ in live]
+                )
+            except Exception as e:
+                for _, fut in live:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            for (_, fut), result in zip(live, results):
+                if not fut.done():
+                    fut.set_result(result)
+        finally:
+            self._slots.release()
+
+toxicity_batcher = ToxicityBatcher(TOXICITY_BATCH_SIZE, TOXICITY_BATCH_WAIT_MS, TOXICITY_WORKERS)
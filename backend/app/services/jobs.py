@@ -0,0 +1,184 @@
+import multiprocessing
+import queue as queue_mod
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from app.core.config import JOB_MAX_RUNNING, JOB_HISTORY
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+def _job_main(fn, kwargs: Dict[str, Any], events):
+    # Entry point in the job process: fn(report, **kwargs), with progress and
+    # the outcome sent back over the events queue.
+    from app.core import startup
+
+    startup.configure_logging()
+
+    def report(progress: float, stage: str):
+        events.put(("progress", float(progress), stage))
+
+    try:
+        events.put(("result", fn(report, **kwargs)))
+    except BaseException as e:
+        events.put(("error", str(e) or type(e).__name__))
+
+class Job:
+    # State of one submitted job, as reported by GET /model/jobs.
+
+    def __init__(self, kind: str, fn: Callable, kwargs: Dict[str, Any], cleanup: Optional[Callable[[], None]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.kwargs = kwargs
+        self.cleanup = cleanup
+        self.state = QUEUED
+        self.progress = 0.0
+        self.stage: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.process = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.state,
+            "progress": round(self.progress, 4),
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobRunner:
+    # Runs CPU-heavy work in separate processes so the event loop (and the
+    # sockets on it) never waits on it. Each job gets its own spawned process,
+    # which is what makes a running job cancellable: ProcessPoolExecutor can
+    # only drop work that has not started. At most max_running run at once;
+    # the rest wait in submission order.
+
+    def __init__(self, max_running: int, history: int):
+        self.max_running = max(1, max_running)
+        self.history = max(1, history)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def submit(self, kind: str, fn: Callable, cleanup: Optional[Callable[[], None]] = None, **kwargs) -> Job:
+        job = Job(kind, fn, kwargs, cleanup)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._trim()
+        self._start_queued()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.as_dict() for job in reversed(list(self.jobs.values()))]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return job
+            was_running = job.state == RUNNING
+            job.state = CANCELLED
+            job.finished_at = time.time()
+        if was_running and job.process is not None:
+            job.process.terminate()
+        elif job.cleanup:
+            job.cleanup()
+        return job
+
+    def shutdown(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history limit.
+        excess = len(self.jobs) - self.history
+        for job_id in [j.id for j in self.jobs.values() if j.state in FINISHED][:max(0, excess)]:
+            del self.jobs[job_id]
+
+    def _start_queued(self):
+        with self._lock:
+            running = sum(1 for j in self.jobs.values() if j.state == RUNNING)
+            to_start = []
+            for job in self.jobs.values():
+                if running >= self.max_running:
+                    break
+                if job.state == QUEUED:
+                    job.state = RUNNING
+                    job.started_at = time.time()
+                    running += 1
+                    to_start.append(job)
+        for job in to_start:
+            events = self._ctx.Queue()
+            job.process = self._ctx.Process(
+                target=_job_main, args=(job.fn, job.kwargs, events), name=f"job-{job.kind}", daemon=True
+            )
+            job.process.start()
+            if job.state == CANCELLED:
+                # Cancelled between being picked and its process existing.
+                job.process.terminate()
+            threading.Thread(target=self._watch, args=(job, events), name=f"job-watch-{job.id[:8]}", daemon=True).start()
+
+    def _handle(self, job: Job, event):
+        if job.state != RUNNING:
+            return
+        if event[0] == "progress":
+            _, job.progress, job.stage = event
+        elif event[0] == "result":
+            job.result = event[1]
+            job.progress = 1.0
+            job.stage = "done"
+            job.state = SUCCEEDED
+            job.finished_at = time.time()
+        elif event[0] == "error":
+            job.error = event[1]
+            job.state = FAILED
+            job.finished_at = time.time()
+
+    def _watch(self, job: Job, events):
+        proc = job.process
+        while True:
+            try:
+                self._handle(job, events.get(timeout=0.5))
+                continue
+            except queue_mod.Empty:
+                pass
+            if proc.is_alive():
+                continue
+            # Exited: whatever it sent before dying is already in the pipe.
+            try:
+                while True:
+                    self._handle(job, events.get_nowait())
+            except queue_mod.Empty:
+                pass
+            break
+
+        proc.join()
+        if job.state == RUNNING:
+            job.state = FAILED
+            job.error = f"Job process exited with code {proc.exitcode}"
+            job.finished_at = time.time()
+        if job.cleanup:
+            job.cleanup()
+        job.process = None
+        self._start_queued()
+
+job_runner = JobRunner(JOB_MAX_RUNNING, JOB_HISTORY)
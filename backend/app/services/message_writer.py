@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import (
+    MESSAGE_BATCH_SIZE,
+    MESSAGE_FLUSH_MS,
+    MESSAGE_DURABILITY,
+    MESSAGE_ID_BLOCK,
+    MESSAGE_WRITE_RETRIES,
+)
+from app.core.metrics import COUNT_BUCKETS, registry as metrics
+from app.database.executor import run_db
+from app.models.models import Message
+
+logger = logging.getLogger(__name__)
+
+INSERT_SECONDS = metrics.histogram(
+    "message_insert_duration_seconds", "Multi-row INSERT + commit of one message batch", ("outcome",)
+)
+INSERT_BATCH = metrics.histogram("message_insert_batch_size", "Messages per INSERT batch", buckets=COUNT_BUCKETS)
+
+DURABILITY_COMMIT = "commit"
+DURABILITY_ASYNC = "async"
+
+_local_id_lock = threading.Lock()
+_local_next_id: Optional[int] = None
+
+def _reserve_ids(db: Session, count: int) -> List[int]:
+    if db.bind.dialect.name == "postgresql":
+        rows = db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :n)"),
+            {"n": count},
+        )
+        return [row[0] for row in rows]
+
+    # No sequences (SQLite): hand out ids above the current maximum. Only
+    # safe with a single writing process, which is all SQLite setups run.
+    global _local_next_id
+    with _local_id_lock:
+        if _local_next_id is None:
+            _local_next_id = (db.query(func.max(Message.id)).scalar() or 0) + 1
+        start = _local_next_id
+        _local_next_id += count
+    return list(range(start, start + count))
+
+def _insert_rows(db: Session, rows: List[Dict[str, Any]]):
+    db.execute(insert(Message.__table__), rows)
+    db.commit()
+
+class MessageWriter:
+    # Write-behind persistence for chat messages. Ids come from blocks reserved
+    # up front, so a message can be broadcast before it is stored; rows are
+    # flushed with one multi-row INSERT every flush_ms or batch_size messages.
+    #
+    # "commit" durability makes submit() wait until its batch is committed;
+    # "async" returns immediately and persists in the background. A message
+    # that cannot be stored fails only its own submit(), never its batch's.
+
+    def __init__(self, batch_size: int, flush_ms: float, durability: str, id_block: int, retries: int):
+        if durability not in (DURABILITY_COMMIT, DURABILITY_ASYNC):
+            raise ValueError(f"Unknown message durability: {durability!r}")
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1.0, flush_ms) / 1000
+        self.durability = durability
+        self.id_block = max(1, id_block)
+        self.retries = max(0, retries)
+        self._buffer: List[Tuple[Dict[str, Any], Optional[asyncio.Future], int]] = []
+        self._ids: Deque[int] = deque()
+        self._id_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.messages_written = 0
+        self.batches_written = 0
+        self.max_batch_size = 0
+        self.failed_batches = 0
+        self.dropped_messages = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        if self._flusher and not self._flusher.done():
+            return
+        self._id_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        # Not cancelled: a batch interrupted mid-INSERT would be lost. The
+        # final flush keeps retrying until every row is written or has used
+        # up its retries, so nothing is left behind uncounted.
+        if self._flusher:
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self._flush(final=True)
+
+    async def _next_id(self) -> int:
+        if not self._ids:
+            async with self._id_lock:
+                if not self._ids:
+                    self._ids.extend(await run_db(_reserve_ids, self.id_block))
+        return self._ids.popleft()
+
+    async def submit(self, msg: Message) -> Message:
+        self.start()
+        if msg.timestamp is None:
+            msg.timestamp = datetime.utcnow()
+        msg.id = await self._next_id()
+
+        row = {
+            "id": msg.id,
+            "room_id": msg.room_id,
+            "sender_id": msg.sender_id,
+            "ciphertext": msg.ciphertext,
+            "is_toxic": bool(msg.is_toxic),
+            "toxicity_prob": float(msg.toxicity_prob or 0.0),
+            "model_version": msg.model_version,
+            "timestamp": msg.timestamp,
+        }
+        fut = asyncio.get_running_loop().create_future() if self.durability == DURABILITY_COMMIT else None
+        self._buffer.append((row, fut, 0))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+        if fut is not None:
+            await fut
+        return msg
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            # asyncio.wait rather than wait_for: on 3.10/3.11 wait_for can
+            # swallow a cancel that lands together with its timeout.
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self, final: bool = False):
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            pending, error = await self._write(batch)
+            if not pending:
+                continue
+            self._retry(pending, error)
+            if not final:
+                return
+            await asyncio.sleep(self.flush_interval)
+
+    async def _write(self, batch) -> Tuple[list, Optional[Exception]]:
+        # Returns the rows that hit a transient error (in order, not yet
+        # requeued) and that error; every other row is written or failed.
+        start = time.perf_counter()
+        try:
+            await run_db(_insert_rows, [row for row, _, _ in batch])
+        except (IntegrityError, DataError) as e:
+            # Some row is bad, the rest of the batch is not: halve until the
+            # offending rows are alone and fail only those.
+            INSERT_SECONDS.labels("error").observe(time.perf_counter() - start)
+            self.failed_batches += 1
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return [], None
+            middle = len(batch) // 2
+            pending, error = await self._write(batch[:middle])
+            if pending:
+                return pending + batch[middle:], error
+            return await self._write(batch[middle:])
+        except Exception as e:
+            INSERT_SECONDS.labels("error").observe(time.perf_counter() - start)
+            self.failed_batches += 1
+            return batch, e
+        elapsed = time.perf_counter() - start
+        INSERT_SECONDS.labels("ok").observe(elapsed)
+        INSERT_BATCH.observe(len(batch))
+        elapsed_ms = elapsed * 1000
+
+        self.batches_written += 1
+        self.messages_written += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+        for _, fut, _ in batch:
+            if fut is not None and not fut.done():
+                fut.set_result(None)
+        return [], None
+
+    def _retry(self, batch, error: Exception):
+        logger.warning("Message batch of %d failed to persist, will retry: %s", len(batch), error)
+        retry, exhausted = [], []
+        for row, fut, attempts in batch:
+            (retry if attempts < self.retries else exhausted).append((row, fut, attempts + 1))
+        if exhausted:
+            self._fail(exhausted, error)
+        # Retried rows go back to the front; the next tick picks them up.
+        self._buffer[:0] = retry
+
+    def _fail(self, rows, error: Exception):
+        logger.error("Dropping %d message(s) that could not be persisted: %s", len(rows), error)
+        self.dropped_messages += len(rows)
+        for _, fut, _ in rows:
+            if fut is not None and not fut.done():
+                fut.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "durability": self.durability,
+            "queued": len(self._buffer),
+            "reserved_ids": len(self._ids),
+            "messages_written": self.messages_written,
+            "batches_written": self.batches_written,
+            "avg_batch_size": round(self.messages_written / self.batches_written, 2) if self.batches_written else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches_written, 3) if self.batches_written else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "failed_batches": self.failed_batches,
+            "dropped_messages": self.dropped_messages,
+        }
+
+message_writer = MessageWriter(
+    MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_MS, MESSAGE_DURABILITY, MESSAGE_ID_BLOCK, MESSAGE_WRITE_RETRIES
+)
+
+metrics.counter_fn("messages_written_total", "Messages persisted", lambda: message_writer.messages_written)
+metrics.counter_fn(
+    "messages_dropped_total", "Messages that could not be persisted: a bad row, or out of retries", lambda: message_writer.dropped_messages
+)
+metrics.gauge_fn("message_write_queue", "Messages waiting to be persisted", lambda: len(message_writer._buffer))
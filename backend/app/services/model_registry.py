@@ -0,0 +1,441 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from app.core import startup
+from app.core.config import MODEL_REGISTRY_DIR, MODEL_SHADOW_MAX_PENDING, TOXICITY_ENCODER_BACKEND
+from app.services.encoders import ONNX_DIR, load_encoder
+from app.services.toxicity_cache import toxicity_cache
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(__file__)
+MODEL_DIR = os.path.abspath(os.path.join(BASE_DIR, "../models"))
+REGISTRY_DIR = os.path.abspath(MODEL_REGISTRY_DIR or os.path.join(MODEL_DIR, "registry"))
+
+# The original, unversioned SBERT files. Served as "legacy-<fingerprint>"
+# until a registry version is activated.
+ENC_DIR = os.path.join(MODEL_DIR, "sbert_encoder")
+CLF_PATH = os.path.join(MODEL_DIR, "sbert_model.pkl")
+THRESH_PATH = os.path.join(MODEL_DIR, "sbert_threshold.txt")
+LEGACY_PREFIX = "legacy-"
+
+KIND_SBERT = "sbert"
+KIND_TFIDF = "tfidf"
+MANIFEST = "manifest.json"
+STATE_FILE = "registry.json"
+ROLLBACK_DEPTH = 10
+# A worker whose model failed to load tries again after this long, or as soon
+# as registry.json or the legacy files change.
+FAILED_RETRY_SECONDS = 60.0
+
+def model_fingerprint() -> str:
+    h = hashlib.sha256()
+    paths = [CLF_PATH, THRESH_PATH]
+    for root, dirs, files in os.walk(ENC_DIR):
+        # Derived exports; writing one must not look like a new model.
+        if ONNX_DIR in dirs:
+            dirs.remove(ONNX_DIR)
+        paths.extend(os.path.join(root, name) for name in files)
+    for path in sorted(paths):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        h.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode())
+    try:
+        with open(THRESH_PATH, "r") as f:
+            h.update(f.read().strip().encode())
+    except OSError:
+        pass
+    return h.hexdigest()[:16]
+
+def read_threshold(path: str, default: float = 0.5) -> float:
+    try:
+        with open(path, "r") as f:
+            return float(f.read().strip())
+    except OSError:
+        return default
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+class LoadedModel:
+    # One version in memory. score() maps cleaned texts to toxicity
+    # probabilities; the instance is never mutated after loading, so a batch
+    # that grabbed it keeps scoring consistently across a swap.
+
+    def __init__(
+        self,
+        version: str,
+        kind: str,
+        threshold: float,
+        score: Callable[[List[str]], Sequence[float]],
+        backend: Optional[str] = None,
+    ):
+        self.version = version
+        self.kind = kind
+        self.threshold = threshold
+        self.score = score
+        self.backend = backend
+
+def _load_sbert(version: str, encoder_dir: str, clf_path: str, thresh_path: str) -> LoadedModel:
+    import joblib
+
+    encoder = load_encoder(encoder_dir, TOXICITY_ENCODER_BACKEND)
+    clf = joblib.load(clf_path)
+
+    def score(texts: List[str]) -> Sequence[float]:
+        return clf.predict_proba(encoder.encode(texts))[:, 1]
+
+    return LoadedModel(version, KIND_SBERT, read_threshold(thresh_path), score, encoder.backend)
+
+def _load_tfidf(version: str, path: str) -> LoadedModel:
+    import joblib
+
+    vectorizer = joblib.load(os.path.join(path, "vectorizer.pkl"))
+    model = joblib.load(os.path.join(path, "model.pkl"))
+
+    def score(texts: List[str]) -> Sequence[float]:
+        return model.predict_proba(vectorizer.transform(texts))[:, 1]
+
+    return LoadedModel(version, KIND_TFIDF, read_threshold(os.path.join(path, "threshold.txt")), score)
+
+def create_version_dir(kind: str) -> Tuple[str, str]:
+    # A staging directory for a new version; publish_version() makes it visible.
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    version = f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    staging = tempfile.mkdtemp(prefix=f".{version}.", dir=REGISTRY_DIR)
+    return version, staging
+
+def publish_version(staging: str, version: str, kind: str, metrics: Optional[Dict[str, Any]] = None) -> str:
+    manifest = {"version": version, "kind": kind, "created_at": time.time(), "metrics": metrics or {}}
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    path = os.path.join(REGISTRY_DIR, version)
+    os.rename(staging, path)
+    return path
+
+class ModelRegistry:
+    # Versioned toxicity models under REGISTRY_DIR, one directory per version
+    # with a manifest.json. registry.json records the active version, the
+    # rollback history and the shadow candidate; every worker follows it.
+    #
+    # New versions load on the caller's thread while traffic keeps using the
+    # current model; the swap is a single reference assignment. A candidate
+    # can shadow-score a sample of traffic off the request path first.
+
+    def __init__(self, root: str, shadow_max_pending: int):
+        self.root = root
+        self.active: Optional[LoadedModel] = None
+        self.candidate: Optional[LoadedModel] = None
+        self.shadow_rate = 0.0
+        self.state = "not_loaded"
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._state_mtime: Optional[float] = None
+        self._syncing = False
+        self._pinned = False
+        self._legacy_fingerprint: Optional[str] = None
+        self._failed_at = 0.0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        # Taken on the toxicity threads, released on the shadow thread.
+        self._shadow_slots = threading.BoundedSemaphore(max(1, shadow_max_pending))
+        self._shadow_drop_lock = threading.Lock()
+        self._reset_shadow_stats()
+
+    # On-disk state
+
+    def _state_path(self) -> str:
+        return os.path.join(self.root, STATE_FILE)
+
+    def read_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path(), "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("active", None)
+        state.setdefault("history", [])
+        state.setdefault("candidate", None)
+        state.setdefault("shadow_rate", 0.0)
+        return state
+
+    def _update_state(self, **changes) -> Dict[str, Any]:
+        with self._state_lock:
+            os.makedirs(self.root, exist_ok=True)
+            state = self.read_state()
+            state.update(changes)
+            _write_json_atomic(self._state_path(), state)
+            self._state_mtime = os.path.getmtime(self._state_path())
+            return state
+
+    def versions(self) -> List[Dict[str, Any]]:
+        found = []
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                try:
+                    with open(os.path.join(self.root, name, MANIFEST), "r") as f:
+                        found.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        if os.path.exists(CLF_PATH):
+            found.append({"version": self._legacy_version(), "kind": KIND_SBERT, "created_at": None, "metrics": {}})
+        found.sort(key=lambda m: m.get("created_at") or 0, reverse=True)
+        return found
+
+    def _legacy_version(self) -> str:
+        if self._legacy_fingerprint is None:
+            self._legacy_fingerprint = model_fingerprint()
+        return LEGACY_PREFIX + self._legacy_fingerprint
+
+    def load(self, version: str) -> LoadedModel:
+        if version.startswith(LEGACY_PREFIX):
+            return _load_sbert(self._legacy_version(), ENC_DIR, CLF_PATH, THRESH_PATH)
+        path = os.path.join(self.root, version)
+        try:
+            with open(os.path.join(path, MANIFEST), "r") as f:
+                manifest = json.load(f)
+        except OSError:
+            raise KeyError(f"Unknown model version: {version}")
+        if manifest["kind"] == KIND_SBERT:
+            return _load_sbert(
+                version,
+                os.path.join(path, "encoder"),
+                os.path.join(path, "classifier.pkl"),
+                os.path.join(path, "threshold.txt"),
+            )
+        if manifest["kind"] == KIND_TFIDF:
+            return _load_tfidf(version, path)
+        raise ValueError(f"Unsupported model kind: {manifest['kind']!r}")
+
+    # Serving
+
+    def current(self) -> Optional[LoadedModel]:
+        # The active model, loading it on first use.
+        if self.state in ("loaded", "failed"):
+            return self.active
+        with self._load_lock:
+            if self.state in ("loaded", "failed"):
+                return self.active
+            self.state = "loading"
+            with startup.timed("model_load"):
+                self._load_from_state()
+        return self.active
+
+    def _load_from_state(self):
+        # Loads what registry.json names (or the legacy files). Until it
+        # succeeds the state stays as it was, so a retry after a failure never
+        # makes current() wait on the load lock.
+        mtime = self._current_mtime()
+        try:
+            state = self.read_state()
+            active = self.load(state["active"] or self._legacy_version())
+            candidate = self.load(state["candidate"]) if state["candidate"] else None
+        except Exception as e:
+            logger.error("Failed to load toxicity model: %s", e)
+            self._state_mtime = mtime
+            self._failed_at = time.monotonic()
+            self.state = "failed"
+            return
+        self.active = active
+        self.candidate = candidate
+        self.shadow_rate = float(state["shadow_rate"]) if candidate else 0.0
+        self._state_mtime = mtime
+        self.state = "loaded"
+        logger.info("Toxicity model %s loaded.", active.version)
+
+    def _retry_failed(self):
+        # sync() for a worker with no model: reload once something changed on
+        # disk, or FAILED_RETRY_SECONDS after the last attempt.
+        fingerprint = model_fingerprint()
+        legacy_changed = self._legacy_fingerprint not in (None, fingerprint)
+        self._legacy_fingerprint = fingerprint
+        if (
+            self._current_mtime() == self._state_mtime
+            and not legacy_changed
+            and time.monotonic() - self._failed_at < FAILED_RETRY_SECONDS
+        ):
+            return
+
+        def retry():
+            try:
+                with self._load_lock:
+                    if self.state == "failed":
+                        self._load_from_state()
+            finally:
+                self._syncing = False
+
+        self._syncing = True
+        threading.Thread(target=retry, name="model-sync", daemon=True).start()
+
+    def _swap(self, model: LoadedModel):
+        self.active = model
+        self.state = "loaded"
+        # Cache keys include the version, so old entries can only go stale.
+        toxicity_cache.clear()
+        logger.info("Toxicity model %s is now active", model.version)
+
+    def serve(self, model: LoadedModel):
+        # Serves a model built in memory (the benchmark stub) and stops
+        # following registry.json, which knows nothing about it.
+        self._pinned = True
+        self._swap(model)
+
+    def activate(self, version: str, record_history: bool = True) -> str:
+        model = self.load(version)
+        state = self.read_state()
+        previous = state["active"] or (self.active.version if self.active else None)
+        history = state["history"]
+        if record_history and previous and previous != version:
+            history = ([previous] + history)[:ROLLBACK_DEPTH]
+        self._update_state(active=version, history=history)
+        self._swap(model)
+        return version
+
+    def rollback(self) -> str:
+        history = self.read_state()["history"]
+        if not history:
+            raise LookupError("No previous model version to roll back to")
+        version = history[0]
+        model = self.load(version)
+        self._update_state(active=version, history=history[1:])
+        self._swap(model)
+        return version
+
+    def set_shadow(self, version: Optional[str], rate: float = 0.0):
+        model = self.load(version) if version else None
+        self._update_state(candidate=version, shadow_rate=rate if version else 0.0)
+        self.candidate, self.shadow_rate = model, (rate if version else 0.0)
+        self._reset_shadow_stats()
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._state_path())
+        except OSError:
+            return None
+
+    def sync(self):
+        # Follows registry.json changes made by other workers (or the CLI).
+        # The reload runs on a background thread; traffic keeps the old model.
+        if self._syncing or self._pinned:
+            return
+        if self.state == "failed":
+            self._retry_failed()
+            return
+        if self.state != "loaded":
+            return
+        mtime = self._current_mtime()
+        legacy_changed = False
+        if self.active.version.startswith(LEGACY_PREFIX):
+            # The legacy files can still be replaced in place.
+            fingerprint = model_fingerprint()
+            legacy_changed = LEGACY_PREFIX + fingerprint != self.active.version
+            self._legacy_fingerprint = fingerprint
+        if mtime == self._state_mtime and not legacy_changed:
+            return
+        self._state_mtime = mtime
+        state = self.read_state()
+        want_active = state["active"] or self._legacy_version()
+        if want_active.startswith(LEGACY_PREFIX):
+            want_active = self._legacy_version()
+        want_candidate = state["candidate"]
+        have_candidate = self.candidate.version if self.candidate else None
+        if want_active == self.active.version and want_candidate == have_candidate:
+            self.shadow_rate = float(state["shadow_rate"]) if want_candidate else 0.0
+            return
+
+        def reload():
+            try:
+                if want_active != self.active.version:
+                    self._swap(self.load(want_active))
+                if want_candidate != have_candidate:
+                    self.candidate = self.load(want_candidate) if want_candidate else None
+                    self._reset_shadow_stats()
+                self.shadow_rate = float(state["shadow_rate"]) if want_candidate else 0.0
+            except Exception as e:
+                logger.error("Failed to follow model registry change: %s", e)
+            finally:
+                self._syncing = False
+
+        self._syncing = True
+        threading.Thread(target=reload, name="model-sync", daemon=True).start()
+
+    # Shadow scoring
+
+    def _reset_shadow_stats(self):
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+        self.shadow_dropped = 0
+        self._shadow_abs_diff = 0.0
+        self._shadow_ms = 0.0
+
+    def shadow(self, texts: List[str], active_results: List[Tuple[int, float]]):
+        # Queue a sample of an already scored batch for the candidate. Never
+        # blocks the caller; when the shadow thread falls behind, samples drop.
+        candidate, rate = self.candidate, self.shadow_rate
+        if candidate is None or rate <= 0:
+            return
+        picked = [i for i in range(len(texts)) if random.random() < rate]
+        if not picked:
+            return
+        if not self._shadow_slots.acquire(blocking=False):
+            with self._shadow_drop_lock:
+                self.shadow_dropped += len(picked)
+            return
+        sample = [texts[i] for i in picked]
+        expected = [active_results[i] for i in picked]
+        try:
+            self._shadow_executor.submit(self._shadow_score, candidate, sample, expected)
+        except RuntimeError:
+            # Executor shut down.
+            self._shadow_slots.release()
+
+    def _shadow_score(self, candidate: LoadedModel, texts: List[str], expected: List[Tuple[int, float]]):
+        try:
+            start = time.perf_counter()
+            probs = candidate.score(texts)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if candidate is not self.candidate:
+                return
+            self._shadow_ms += elapsed_ms
+            for p, (pred, prob) in zip(probs, expected):
+                self.shadow_compared += 1
+                self.shadow_agreed += int(int(p >= candidate.threshold) == pred)
+                self._shadow_abs_diff += abs(float(p) - prob)
+        except Exception as e:
+            logger.warning("Shadow scoring with %s failed: %s", candidate.version, e)
+        finally:
+            self._shadow_slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.read_state()
+        compared = self.shadow_compared
+        return {
+            "state": self.state,
+            "active": self.active.version if self.active else None,
+            "active_kind": self.active.kind if self.active else None,
+            "active_backend": self.active.backend if self.active else None,
+            "history": state["history"],
+            "shadow": {
+                "candidate": self.candidate.version if self.candidate else None,
+                "rate": self.shadow_rate,
+                "compared": compared,
+                "agreement": round(self.shadow_agreed / compared, 4) if compared else None,
+                "mean_abs_prob_diff": round(self._shadow_abs_diff / compared, 4) if compared else None,
+                "candidate_ms_per_text": round(self._shadow_ms / compared, 3) if compared else None,
+                "dropped": self.shadow_dropped,
+            },
+        }
+
+registry = ModelRegistry(REGISTRY_DIR, MODEL_SHADOW_MAX_PENDING)
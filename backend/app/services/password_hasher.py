@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from passlib.context import CryptContext
+from app.core.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_contexts: Dict[int, CryptContext] = {}
+
+def _context(rounds: int) -> CryptContext:
+    # One context per cost, built lazily inside each worker process.
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return ctx
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+def _verify(password: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    # verify_and_update returns a new hash when the stored one was made with
+    # a different cost, so logins migrate users to BCRYPT_ROUNDS over time.
+    try:
+        return _context(rounds).verify_and_update(password, hashed)
+    except Exception as e:
+        logger.warning("verify_password error: %s", e)
+        return False, None
+
+class HasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    # bcrypt on its own process pool. At most `workers` hashes run at once and
+    # at most `max_waiting` more wait for a slot, each for up to queue_timeout
+    # seconds; past that HasherBusy is raised so callers can answer 503 instead
+    # of stacking up requests.
+
+    def __init__(self, workers: int, max_waiting: int, queue_timeout: float, rounds: int):
+        self.workers = max(1, workers)
+        self.max_waiting = max(0, max_waiting)
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_ms = 0.0
+        self._total_ms = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs event-loop and
+            # database threads is not safe.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._slots = None
+
+    async def _acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise HasherBusy()
+
+        self.waiting += 1
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        try:
+            done, _ = await asyncio.wait({acquire}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # The caller went away; hand back a slot we may have just won.
+            if acquire.done() and not acquire.cancelled():
+                self._slots.release()
+            acquire.cancel()
+            raise
+        finally:
+            self.waiting -= 1
+        if not done:
+            acquire.cancel()
+            self.timed_out += 1
+            raise HasherBusy()
+
+    async def _run(self, fn, *args):
+        await self._acquire()
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.in_flight -= 1
+            self.completed += 1
+            self._total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        # (matches, replacement hash or None)
+        ok, new_hash = await self._run(_verify, password, hashed, self.rounds)
+        if ok and new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "bcrypt_rounds": self.rounds,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "avg_ms": round(self._total_ms / self.completed, 3) if self.completed else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rehashed": self.rehashed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT, BCRYPT_ROUNDS)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from app.core.config import BROADCAST_BACKEND, BROADCAST_CHANNEL, DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process on the shared channel so it can skip its own events;
+# the publishing worker has already delivered them locally.
+WORKER_ID = uuid.uuid4().hex
+
+Handler = Callable[[Dict[str, Any]], None]
+
+class BroadcastBackend:
+    # Carries room events between workers. publish() must not deliver back to
+    # the local subscriber: ConnectionManager does that itself, synchronously.
+    # It returns False, without sending, for an event over MAX_PAYLOAD bytes;
+    # the caller can then publish something smaller that stands for it.
+
+    MAX_PAYLOAD: Optional[int] = None
+
+    async def start(self, handler: Handler):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def publish(self, event: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+class InMemoryBackend(BroadcastBackend):
+    # Hub shared by every subscriber in this process. With a single
+    # ConnectionManager it delivers nothing, which is the single-worker case.
+
+    _subscribers: List[Handler] = []
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self.published = 0
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        self._subscribers.append(handler)
+
+    async def stop(self):
+        if self._handler in self._subscribers:
+            self._subscribers.remove(self._handler)
+        self._handler = None
+
+    async def publish(self, event: Dict[str, Any]) -> bool:
+        self.published += 1
+        for handler in list(self._subscribers):
+            if handler is not self._handler:
+                handler(event)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "published": self.published, "subscribers": len(self._subscribers)}
+
+class PostgresBackend(BroadcastBackend):
+    # LISTEN/NOTIFY over the application database. The listening connection
+    # is watched with loop.add_reader; NOTIFYs go out in order on a single
+    # publisher thread so the event loop never waits on Postgres.
+
+    MAX_PAYLOAD = 7900  # NOTIFY payloads must stay under 8000 bytes
+    RECONNECT_DELAY = 2.0
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self._handler: Optional[Handler] = None
+        self._listen_conn = None
+        self._publish_conn = None
+        self._publisher: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.published = 0
+        self.received = 0
+        self.oversized = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pubsub")
+        await self._loop.run_in_executor(self._publisher, self._listen)
+
+    def _listen(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN "{self.channel}"')
+        self._listen_conn = conn
+        self._loop.call_soon_threadsafe(self._loop.add_reader, conn.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            logger.warning("Broadcast listener lost its connection: %s", e)
+            self._drop_listener()
+            self._schedule_reconnect()
+            return
+        while conn.notifies:
+            note = conn.notifies.pop(0)
+            try:
+                event = json.loads(note.payload)
+            except ValueError:
+                continue
+            if event.get("origin") == WORKER_ID:
+                continue
+            self.received += 1
+            try:
+                self._handler(event)
+            except Exception as e:
+                logger.exception("Broadcast event handling failed: %s", e)
+
+    def _drop_listener(self):
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            self._loop.remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _schedule_reconnect(self):
+        if self._stopping or (self._reconnect_task and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                await self._loop.run_in_executor(self._publisher, self._listen)
+                self.reconnects += 1
+                return
+            except Exception as e:
+                logger.warning("Broadcast listener reconnect failed: %s", e)
+
+    def _notify(self, payload: str):
+        import psycopg2
+        import psycopg2.extensions
+
+        for attempt in range(2):
+            try:
+                if self._publish_conn is None or self._publish_conn.closed:
+                    self._publish_conn = psycopg2.connect(self.dsn)
+                    self._publish_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with self._publish_conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                return
+            except psycopg2.OperationalError:
+                self._publish_conn = None
+                if attempt:
+                    raise
+
+    def _on_published(self, fut):
+        if fut.exception() is not None:
+            self.publish_errors += 1
+            logger.error("Broadcast publish failed: %s", fut.exception())
+
+    async def publish(self, event: Dict[str, Any]) -> bool:
+        payload = json.dumps({**event, "origin": WORKER_ID})
+        if len(payload.encode("utf-8")) > self.MAX_PAYLOAD:
+            self.oversized += 1
+            return False
+        self.published += 1
+        fut = self._loop.run_in_executor(self._publisher, self._notify, payload)
+        fut.add_done_callback(self._on_published)
+        return True
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        self._drop_listener()
+        if self._publish_conn is not None:
+            try:
+                self._publish_conn.close()
+            except Exception:
+                pass
+            self._publish_conn = None
+        if self._publisher is not None:
+            self._publisher.shutdown(wait=False)
+            self._publisher = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "postgres",
+            "channel": self.channel,
+            "listening": self._listen_conn is not None,
+            "published": self.published,
+            "received": self.received,
+            "oversized": self.oversized,
+            "publish_errors": self.publish_errors,
+            "reconnects": self.reconnects,
+        }
+
+def create_backend(name: str = BROADCAST_BACKEND) -> BroadcastBackend:
+    if name == "postgres":
+        from sqlalchemy.engine import make_url
+
+        dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresBackend(dsn, BROADCAST_CHANNEL)
+    if name == "memory":
+        return InMemoryBackend()
+    raise ValueError(f"Unknown broadcast backend: {name!r}")
@@ -0,0 +1,171 @@
+import logging
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+from app.core.config import (
+    WS_MAX_CONNECTIONS,
+    WS_MESSAGE_RATE_PER_CONNECTION,
+    WS_MESSAGE_RATE_PER_ROOM,
+    WS_MESSAGE_RATE_PER_USER,
+    WS_RATE_BURST_SECONDS,
+    WS_TYPING_RATE_PER_CONNECTION,
+    WS_TYPING_RATE_PER_ROOM,
+    WS_TYPING_RATE_PER_USER,
+)
+from app.core.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# RFC 6455: 1008 policy violation, 1013 try again later.
+POLICY_VIOLATION_CLOSE_CODE = 1008
+TRY_AGAIN_LATER_CLOSE_CODE = 1013
+
+RATE_LIMITED = metrics.counter(
+    "ws_rate_limited_total", "Inbound frames dropped by a rate limit, by the scope that ran out", ("kind", "scope")
+)
+ADMISSION_REJECTED = metrics.counter(
+    "ws_admission_rejected_total", "WebSocket connections refused at WS_MAX_CONNECTIONS"
+)
+INBOUND_DROPPED = metrics.counter(
+    "ws_inbound_dropped_total", "Typing events dropped because the inbound queue was full"
+)
+POLICY_CLOSES = metrics.counter(
+    "ws_policy_closes_total", "WebSocket sessions closed by admission or inbound limits", ("reason",)
+)
+
+SCOPES = ("connection", "user", "room")
+# Idle user and room buckets are refilled and dropped this often.
+_SWEEP_INTERVAL = 30.0
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def wait_time(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class RateLimiter:
+    # Token buckets for inbound WebSocket frames, with a separate budget per
+    # frame kind ("message", "typing") at each scope: the connection, the user
+    # across all of their connections, and the room. A frame passes only if
+    # every bucket it falls under has a token, and only then takes one from
+    # each, so a room at its limit does not also drain its members' budgets.
+    #
+    # Buckets hold WS_RATE_BURST_SECONDS worth of tokens. Limits are per worker
+    # process; a rate of 0 disables that bucket.
+
+    def __init__(self, rates: Dict[Tuple[str, str], float], burst_seconds: float):
+        self.rates = {key: rate for key, rate in rates.items() if rate > 0}
+        self.burst_seconds = burst_seconds
+        self._buckets: Dict[Tuple[str, str, Hashable], TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        self.allowed = 0
+        self.limited: Dict[str, int] = {}
+
+    def _bucket(self, kind: str, scope: str, key: Hashable, now: float) -> Optional[TokenBucket]:
+        rate = self.rates.get((kind, scope))
+        if rate is None:
+            return None
+        bucket = self._buckets.get((kind, scope, key))
+        if bucket is None:
+            bucket = TokenBucket(rate, max(1.0, rate * self.burst_seconds), now)
+            self._buckets[(kind, scope, key)] = bucket
+        return bucket
+
+    def check(self, kind: str, conn_id: int, user_id: int, room_name: str) -> Optional[Tuple[str, float]]:
+        # None if the frame may go through, otherwise the scope that is out of
+        # tokens and the seconds until it has one again.
+        now = time.monotonic()
+        if now - self._last_sweep >= _SWEEP_INTERVAL:
+            self._sweep(now)
+        buckets = []
+        for scope, key in zip(SCOPES, (conn_id, user_id, room_name)):
+            bucket = self._bucket(kind, scope, key, now)
+            if bucket is None:
+                continue
+            if bucket.refill(now) < 1:
+                self.limited[f"{kind}:{scope}"] = self.limited.get(f"{kind}:{scope}", 0) + 1
+                RATE_LIMITED.labels(kind, scope).inc()
+                return scope, bucket.wait_time()
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.tokens -= 1
+        self.allowed += 1
+        return None
+
+    def release(self, conn_id: int):
+        for kind, scope in self.rates:
+            if scope == "connection":
+                self._buckets.pop((kind, scope, conn_id), None)
+
+    def _sweep(self, now: float):
+        # A bucket that has refilled to capacity behaves exactly like a new one.
+        self._last_sweep = now
+        idle = [key for key, bucket in self._buckets.items() if bucket.refill(now) >= bucket.capacity]
+        for key in idle:
+            del self._buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rates": {f"{kind}:{scope}": rate for (kind, scope), rate in self.rates.items()},
+            "burst_seconds": self.burst_seconds,
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": dict(self.limited),
+        }
+
+class AdmissionGate:
+    # Caps concurrent WebSocket sessions per worker. Taken before the handshake
+    # does any work (token check, room lookup), so a connection storm is
+    # refused cheaply; 0 means unlimited.
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.limit and self.active >= self.limit:
+            self.rejected += 1
+            ADMISSION_REJECTED.inc()
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "active": self.active, "rejected": self.rejected}
+
+async def close_for_policy(websocket, code: int, reason: str):
+    POLICY_CLOSES.labels(reason).inc()
+    try:
+        await websocket.close(code=code, reason=reason)
+    except Exception as e:
+        logger.debug("Closing socket (%s) failed: %s", reason, e)
+
+ws_limiter = RateLimiter(
+    {
+        ("message", "connection"): WS_MESSAGE_RATE_PER_CONNECTION,
+        ("message", "user"): WS_MESSAGE_RATE_PER_USER,
+        ("message", "room"): WS_MESSAGE_RATE_PER_ROOM,
+        ("typing", "connection"): WS_TYPING_RATE_PER_CONNECTION,
+        ("typing", "user"): WS_TYPING_RATE_PER_USER,
+        ("typing", "room"): WS_TYPING_RATE_PER_ROOM,
+    },
+    WS_RATE_BURST_SECONDS,
+)
+ws_admission = AdmissionGate(WS_MAX_CONNECTIONS)
+
+metrics.gauge_fn("ws_admitted_connections", "WebSocket sessions holding an admission slot", lambda: ws_admission.active)
+metrics.gauge_fn("ws_rate_limit_buckets", "Live token buckets", lambda: len(ws_limiter._buckets))
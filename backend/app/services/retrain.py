@@ -0,0 +1,108 @@
+import logging
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Runs inside a job process (see app.services.jobs), never on the API worker:
+# pandas and scikit-learn are only imported here.
+
+Report = Callable[[float, str], None]
+
+def _load_messages(report: Report, yield_per: int) -> List[Dict[str, Any]]:
+    from sqlalchemy import func, select
+    from app.database.database import SessionLocal
+    from app.models.models import ChatRoom, Message
+    from app.services.encryption import decrypt_many
+    from app.services.toxicity import clean_text
+
+    db = SessionLocal()
+    try:
+        total = db.execute(select(func.count(Message.id))).scalar() or 0
+        if not total:
+            raise ValueError("No messages available for retraining")
+
+        # Streamed in yield_per-sized partitions (a server-side cursor on
+        # Postgres); each partition is decrypted with its room keys in bulk.
+        stmt = (
+            select(Message.ciphertext, Message.is_toxic, ChatRoom.symmetric_key)
+            .join(ChatRoom, ChatRoom.id == Message.room_id)
+            .execution_options(yield_per=yield_per)
+        )
+        rows: List[Dict[str, Any]] = []
+        seen = 0
+        for partition in db.execute(stmt).partitions():
+            by_key: Dict[str, List] = {}
+            for ciphertext, is_toxic, key in partition:
+                by_key.setdefault(key, []).append((ciphertext, is_toxic))
+            for key, items in by_key.items():
+                results = decrypt_many(key, [c for c, _ in items])
+                for (plaintext, error), (_, is_toxic) in zip(results, items):
+                    if error is None:
+                        rows.append({"text": clean_text(plaintext), "label": int(bool(is_toxic))})
+            seen += len(partition)
+            report(0.4 * seen / max(total, seen), f"loaded {seen}/{total} messages")
+        return rows
+    finally:
+        db.close()
+
+def retrain(report: Report, csv_path: Optional[str] = None, yield_per: int = 1000) -> Dict[str, Any]:
+    import joblib
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import accuracy_score
+    from sklearn.model_selection import train_test_split
+    from app.services.model_registry import KIND_TFIDF, create_version_dir, publish_version
+    from app.services.toxicity import clean_text
+
+    report(0.0, "loading data")
+    if csv_path:
+        df = pd.read_csv(csv_path)
+        if "text" not in df.columns or "label" not in df.columns:
+            raise ValueError("CSV must contain 'text' and 'label' columns")
+        logger.info("Loaded dataset from upload: %d samples", df.shape[0])
+    else:
+        df = pd.DataFrame(_load_messages(report, yield_per))
+        if df.empty:
+            raise ValueError("No readable messages available for retraining")
+        logger.info("Loaded %d messages from database for retraining", len(df))
+
+    df["text"] = df["text"].astype(str).apply(clean_text)
+    report(0.45, "vectorizing")
+    X_train, X_test, y_train, y_test = train_test_split(
+        df["text"], df["label"], test_size=0.2, random_state=42
+    )
+    vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
+    X_train_vec = vectorizer.fit_transform(X_train)
+    X_test_vec = vectorizer.transform(X_test)
+
+    report(0.6, "fitting")
+    model = LogisticRegression(max_iter=200)
+    model.fit(X_train_vec, y_train)
+
+    report(0.85, "evaluating")
+    acc = accuracy_score(y_test, model.predict(X_test_vec))
+    logger.info("Retrained model accuracy: %.4f", acc)
+
+    report(0.95, "saving")
+    # Published as a new registry version; serving only switches to it when
+    # it is activated (POST /model/versions/{version}/activate).
+    version, staging = create_version_dir(KIND_TFIDF)
+    try:
+        joblib.dump(vectorizer, os.path.join(staging, "vectorizer.pkl"))
+        joblib.dump(model, os.path.join(staging, "model.pkl"))
+        path = publish_version(staging, version, KIND_TFIDF, {"samples": len(df), "accuracy": round(acc, 4)})
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info("Published model version %s to %s", version, path)
+
+    return {
+        "message": "Model retrained successfully",
+        "samples": len(df),
+        "accuracy": round(acc, 4),
+        "version": version,
+        "model_path": path,
+    }
@@ -0,0 +1,28 @@
+from typing import NamedTuple, Optional
+from sqlalchemy import event
+from app.core.config import ROOM_CACHE_SIZE, ROOM_CACHE_TTL
+from app.models.models import ChatRoom
+from app.utils.ttl_cache import TTLCache
+
+class RoomInfo(NamedTuple):
+    id: int
+    name: str
+    symmetric_key: Optional[str]
+
+# Room name -> RoomInfo. Rooms are never renamed and a key is only ever set
+# once, so entries stay valid; the TTL just bounds memory for idle rooms.
+room_cache = TTLCache(ROOM_CACHE_SIZE, ROOM_CACHE_TTL)
+
+def get_cached_room(name: str) -> Optional[RoomInfo]:
+    return room_cache.get(name)
+
+def cache_room(room, generation: Optional[int] = None) -> RoomInfo:
+    info = RoomInfo(room.id, room.name, room.symmetric_key)
+    if info.symmetric_key:
+        room_cache.put(info.name, info, generation=generation)
+    return info
+
+@event.listens_for(ChatRoom, "after_update")
+@event.listens_for(ChatRoom, "after_delete")
+def _invalidate_room(mapper, connection, target):
+    room_cache.invalidate(target.name)
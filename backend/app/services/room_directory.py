@@ -0,0 +1,266 @@
+import base64
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import and_, case, event, func, literal, or_, select
+from sqlalchemy.orm import Session, object_session
+from app.core.config import ROOM_DIRECTORY_CACHE_SIZE, ROOM_DIRECTORY_CACHE_TTL
+from app.models.models import ChatRoom, UserRoom
+from app.utils.ttl_cache import TTLCache
+
+# Results are ordered by (tier, -members, name): exact name match, then
+# prefix, then substring; busier rooms first within a tier. Names are unique,
+# so that key is also the keyset cursor.
+TIER_EXACT, TIER_PREFIX, TIER_SUBSTRING = 0, 1, 2
+
+SortKey = Tuple[int, int, str]
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(key: SortKey) -> str:
+    tier, neg_members, name = key
+    raw = json.dumps([tier, -neg_members, name], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> SortKey:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        tier, members, name = json.loads(raw)
+        return int(tier), -int(members), str(name)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+def _tier(name_lower: str, query: str) -> int:
+    if name_lower == query:
+        return TIER_EXACT
+    if name_lower.startswith(query):
+        return TIER_PREFIX
+    return TIER_SUBSTRING
+
+def _escape_like(query: str) -> str:
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# A change to the directory, as queued on a session until it commits:
+# ("room", room_id, name), name None for a deleted room, or
+# ("members", room_id, delta).
+Change = Tuple[str, int, Any]
+
+class TrigramIndex:
+    # In-process stand-in for pg_trgm on SQLite setups: room names and member
+    # counts, with a trigram -> room ids map to narrow substring matches. Built
+    # from the database on first use, then kept current by applying each
+    # committed room or membership change; mark_stale() forces a full rebuild
+    # for writes that bypass the ORM.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        self._names: Dict[int, str] = {}
+        self._members: Dict[int, int] = {}
+        self._postings: Dict[str, Set[int]] = {}
+
+    def mark_stale(self):
+        self._stale = True
+
+    def _rebuild(self, db: Session):
+        rows = db.execute(select(ChatRoom.id, ChatRoom.name, ChatRoom.member_count)).all()
+        self._names = {room_id: name for room_id, name, _ in rows}
+        self._members = {room_id: members for room_id, _, members in rows}
+        self._postings = {}
+        for room_id, name in self._names.items():
+            self._index(room_id, name)
+
+    def _index(self, room_id: int, name: str):
+        for gram in _trigrams(name.lower()):
+            self._postings.setdefault(gram, set()).add(room_id)
+
+    def _unindex(self, room_id: int, name: str):
+        for gram in _trigrams(name.lower()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(room_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def apply(self, changes: Iterable[Change]):
+        with self._lock:
+            if self._stale:
+                # Not built yet (or about to be rebuilt): nothing to update.
+                return
+            for kind, room_id, value in changes:
+                if kind == "members":
+                    self._members[room_id] = self._members.get(room_id, 0) + value
+                    continue
+                old = self._names.pop(room_id, None)
+                if old is not None:
+                    self._unindex(room_id, old)
+                if value is None:
+                    self._members.pop(room_id, None)
+                else:
+                    self._names[room_id] = value
+                    self._index(room_id, value)
+
+    def search(self, db: Session, query: str, after: Optional[SortKey], limit: int) -> List[Tuple[SortKey, int]]:
+        # Held for the whole scan: apply() updates the maps in place.
+        with self._lock:
+            if self._stale:
+                self._stale = False
+                self._rebuild(db)
+            return self._search(query, after, limit)
+
+    def _search(self, query: str, after: Optional[SortKey], limit: int) -> List[Tuple[SortKey, int]]:
+        names, members, postings = self._names, self._members, self._postings
+        if not query:
+            candidates = names.keys()
+        else:
+            # Every trigram inside the query (ignoring the padded edges) must
+            # occur in a matching name; short queries fall back to a scan.
+            grams = {g for g in _trigrams(query) if " " not in g}
+            if grams:
+                sets = sorted((postings.get(g, set()) for g in grams), key=len)
+                candidates = set.intersection(*sets)
+            else:
+                candidates = names.keys()
+
+        rows = []
+        for room_id in candidates:
+            name = names[room_id]
+            lower = name.lower()
+            if query and query not in lower:
+                continue
+            key = (_tier(lower, query) if query else TIER_EXACT, -members.get(room_id, 0), name)
+            if after is None or key > after:
+                rows.append((key, room_id))
+        rows.sort()
+        return rows[:limit]
+
+class RoomDirectory:
+    # Paginated room search. Postgres does the matching in SQL (ILIKE, served
+    # by the pg_trgm index from migration 3); other databases use TrigramIndex.
+    # Pages are cached for a few seconds and dropped whenever a room or a
+    # membership change commits in this process.
+
+    def __init__(self, cache_size: int, cache_ttl: float):
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.memory_index = TrigramIndex()
+
+    def invalidate(self):
+        self.memory_index.mark_stale()
+        self.cache.clear()
+
+    def apply(self, changes: Iterable[Change]):
+        self.memory_index.apply(changes)
+        self.cache.clear()
+
+    def _search_sql(self, db: Session, query: str, after: Optional[SortKey], limit: int) -> List[Tuple[SortKey, int]]:
+        # The stored count (migration 5): nothing is counted per search.
+        members = ChatRoom.member_count
+        name_lower = func.lower(ChatRoom.name)
+        if query:
+            escaped = _escape_like(query)
+            tier = case(
+                (name_lower == query, TIER_EXACT),
+                (name_lower.like(f"{escaped}%", escape="\\"), TIER_PREFIX),
+                else_=TIER_SUBSTRING,
+            )
+        else:
+            tier = literal(TIER_EXACT)
+
+        inner = select(
+            ChatRoom.id.label("id"),
+            ChatRoom.name.label("name"),
+            tier.label("tier"),
+            members.label("members"),
+        )
+        if query:
+            inner = inner.where(ChatRoom.name.ilike(f"%{escaped}%", escape="\\"))
+        ranked = inner.subquery()
+
+        stmt = select(ranked).order_by(ranked.c.tier, ranked.c.members.desc(), ranked.c.name).limit(limit)
+        if after is not None:
+            tier_after, neg_members, name_after = after
+            members_after = -neg_members
+            stmt = stmt.where(
+                or_(
+                    ranked.c.tier > tier_after,
+                    and_(
+                        ranked.c.tier == tier_after,
+                        or_(
+                            ranked.c.members < members_after,
+                            and_(ranked.c.members == members_after, ranked.c.name > name_after),
+                        ),
+                    ),
+                )
+            )
+        return [((row.tier, -row.members, row.name), row.id) for row in db.execute(stmt)]
+
+    def search(self, db: Session, query: Optional[str], limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        query = (query or "").strip().lower()
+        after = decode_cursor(cursor) if cursor else None
+        cache_key = (query, limit, cursor)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation
+        # One extra row tells us whether there is a next page.
+        if db.bind.dialect.name == "postgresql":
+            rows = self._search_sql(db, query, after, limit + 1)
+        else:
+            rows = self.memory_index.search(db, query, after, limit + 1)
+
+        page = rows[:limit]
+        result = {
+            "rooms": [{"id": room_id, "name": key[2], "user_count": -key[1]} for key, room_id in page],
+            "next_cursor": encode_cursor(page[-1][0]) if len(rows) > limit else None,
+        }
+        self.cache.put(cache_key, result, generation=generation)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+room_directory = RoomDirectory(ROOM_DIRECTORY_CACHE_SIZE, ROOM_DIRECTORY_CACHE_TTL)
+
+# ORM changes are queued on their session at flush and reach the directory
+# only when that session commits, so a rolled-back join never counts.
+_PENDING_KEY = "room_directory_changes"
+
+def _queue(target, change: Change):
+    session = object_session(target)
+    if session is None:
+        room_directory.invalidate()
+        return
+    session.info.setdefault(_PENDING_KEY, []).append(change)
+
+@event.listens_for(ChatRoom, "after_insert")
+@event.listens_for(ChatRoom, "after_update")
+def _room_saved(mapper, connection, target):
+    _queue(target, ("room", target.id, target.name))
+
+@event.listens_for(ChatRoom, "after_delete")
+def _room_deleted(mapper, connection, target):
+    _queue(target, ("room", target.id, None))
+
+@event.listens_for(UserRoom, "after_insert")
+def _member_added(mapper, connection, target):
+    _queue(target, ("members", target.room_id, 1))
+
+@event.listens_for(UserRoom, "after_delete")
+def _member_removed(mapper, connection, target):
+    _queue(target, ("members", target.room_id, -1))
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        room_directory.apply(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
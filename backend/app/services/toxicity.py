@@ -1,29 +1,44 @@
-import os
 import re
-from typing import Tuple
-import joblib
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+from typing import List, Optional, Tuple
+from app.core import startup
+from app.core.config import TOXICITY_CACHE_CHECK_SECONDS
+from app.core.metrics import COUNT_BUCKETS, registry as metrics
+from app.services.model_registry import registry
+from app.services.toxicity_cache import toxicity_cache
 
-BASE_DIR = os.path.dirname(__file__)
-MODEL_DIR = os.path.abspath(os.path.join(BASE_DIR, "../models"))
+PREDICT_SECONDS = metrics.histogram(
+    "toxicity_predict_duration_seconds", "predict_toxicity_batch latency, cache lookups included"
+)
+PREDICT_BATCH = metrics.histogram("toxicity_predict_batch_size", "Texts per predict_toxicity_batch call", buckets=COUNT_BUCKETS)
+metrics.counter_fn("toxicity_cache_hits_total", "Toxicity results served from cache", lambda: toxicity_cache.hits)
+metrics.counter_fn("toxicity_cache_misses_total", "Toxicity results computed by the model", lambda: toxicity_cache.misses)
 
-ENC_DIR = os.path.join(MODEL_DIR, "sbert_encoder")
-CLF_PATH = os.path.join(MODEL_DIR, "sbert_model.pkl")
-THRESH_PATH = os.path.join(MODEL_DIR, "sbert_threshold.txt")
+_sync_lock = threading.Lock()
+_synced_at = time.monotonic()
 
-try:
-    encoder = SentenceTransformer(ENC_DIR)
-    clf = joblib.load(CLF_PATH)
+# Models are loaded on first use (or by warm_up() from the startup event), so
+# importing this module never pays the torch import cost. Which version serves
+# traffic is decided by the model registry.
 
-    with open(THRESH_PATH, "r") as f:
-        THRESH = float(f.read().strip())
+def load_model() -> bool:
+    return registry.current() is not None
 
-    print("SBERT toxicity model loaded.")
-except Exception as e:
-    print(f"Failed to load SBERT model: {e}")
-    encoder = None
-    clf = None
-    THRESH = 0.5
+def is_model_loaded() -> bool:
+    return registry.state == "loaded"
+
+def model_state() -> str:
+    return registry.state
+
+def model_version() -> Optional[str]:
+    return registry.active.version if registry.active else None
+
+def warm_up():
+    if not load_model():
+        return
+    with startup.timed("model_warmup"):
+        registry.active.score(["warm up"])
 
 def clean_text(s: str) -> str:
     if not s:
@@ -34,19 +49,57 @@ def clean_text(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
-def predict_toxicity(text: str) -> Tuple[int, float]:
-    if encoder is None or clf is None:
-        return 0, 0.0
+def refresh_model_version():
+    global _synced_at
+
+    if time.monotonic() - _synced_at < TOXICITY_CACHE_CHECK_SECONDS:
+        return
+    with _sync_lock:
+        if time.monotonic() - _synced_at < TOXICITY_CACHE_CHECK_SECONDS:
+            return
+        _synced_at = time.monotonic()
+        registry.sync()
+
+def predict_toxicity_batch(texts: List[str]) -> List[Tuple[int, float, Optional[str]]]:
+    # (prediction, probability, version that scored it) per text. The model is
+    # picked once, so a batch is never split across a swap.
+    # Checked first: it is also how a worker whose model failed to load
+    # picks up a version activated elsewhere.
+    refresh_model_version()
+    model = registry.current()
+    if model is None:
+        return [(0, 0.0, None) for _ in texts]
+
+    if not texts:
+        return []
+
+    start = time.perf_counter()
+    version, thresh = model.version, model.threshold
+
+    texts_clean = [clean_text(t) for t in texts]
+    keys = [toxicity_cache.make_key(t, version) for t in texts_clean]
+    results = [toxicity_cache.get(k) for k in keys]
+
+    # Identical misses within one batch are encoded once.
+    missing = {}
+    for i, result in enumerate(results):
+        if result is None:
+            missing.setdefault(keys[i], texts_clean[i])
+
+    if missing:
+        probs = model.score(list(missing.values()))
 
-    text_clean = clean_text(text)
+        scored = {}
+        for key, p in zip(missing, probs):
+            scored[key] = (int(p >= thresh), float(p))
+            toxicity_cache.put(key, scored[key])
 
-    emb = encoder.encode(
-        [text_clean],
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
+        results = [r if r is not None else scored[k] for r, k in zip(results, keys)]
 
-    prob = clf.predict_proba(emb)[0][1]
-    pred = int(prob >= THRESH)
+    registry.shadow(texts_clean, results)
+    PREDICT_SECONDS.observe(time.perf_counter() - start)
+    PREDICT_BATCH.observe(len(texts))
+    return [(pred, prob, version) for pred, prob in results]
 
-    return pred, float(prob)
+def predict_toxicity(text: str) -> Tuple[int, float, Optional[str]]:
+    return predict_toxicity_batch([text])[0]
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.core.config import TOXICITY_CACHE_SIZE, TOXICITY_CACHE_TTL
+
+class ToxicityCache:
+    # Bounded LRU of (pred, prob) keyed on sha256(model version + cleaned text).
+    # Entries also expire after ttl_seconds; a max_entries of 0 disables caching.
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(text_clean: str, model_version: str) -> str:
+        return hashlib.sha256(f"{model_version}\0{text_clean}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[int, float]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, pred, prob = entry
+            if self.ttl > 0 and expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pred, prob
+
+    def put(self, key: str, result: Tuple[int, float]):
+        if self.max_entries <= 0:
+            return
+        pred, prob = result
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, pred, prob)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+toxicity_cache = ToxicityCache(TOXICITY_CACHE_SIZE, TOXICITY_CACHE_TTL)
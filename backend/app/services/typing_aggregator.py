@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.core.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+TYPING_UPDATES = metrics.counter(
+    "typing_updates_total", "Typing events received, by effect on the room's state", ("outcome",)
+)
+TYPING_FRAMES = metrics.counter("typing_frames_total", "Coalesced typing frames sent to a room")
+
+class _RoomTyping:
+    __slots__ = ("local", "remote", "sent", "published", "published_at")
+
+    def __init__(self):
+        # conn_id -> (username, expires_at) for members on this worker.
+        self.local: Dict[int, Tuple[str, float]] = {}
+        # worker id -> (usernames, expires_at) as last published by that worker.
+        self.remote: Dict[str, Tuple[Tuple[str, ...], float]] = {}
+        self.sent: Tuple[str, ...] = ()
+        self.published: Tuple[str, ...] = ()
+        self.published_at = 0.0
+
+    def local_names(self) -> Tuple[str, ...]:
+        return tuple(sorted({name for name, _ in self.local.values()}))
+
+class TypingAggregator:
+    # Who is typing, per room. Typing events only update state; every
+    # TYPING_TICK_MS each room whose typists changed gets one frame listing
+    # all of them, serialized once for every member:
+    #     {"event": "typing", "users": ["alice", "bob"]}
+    # The list includes the recipient when they are typing themselves.
+    #
+    # A member drops out TYPING_TIMEOUT seconds after their last is_typing,
+    # on is_typing false, on sending a message or on disconnect. Repeats of
+    # the current state only extend the timeout. Each worker publishes its
+    # local typists per room when they change (and again every half timeout
+    # while anyone types) and merges what the others publish, so the list
+    # covers the whole room; a worker that goes quiet ages out the same way.
+
+    def __init__(self, tick_ms: float, timeout: float):
+        self.tick = tick_ms / 1000
+        self.timeout = timeout
+        # Keys this aggregator's typists in other workers' state.
+        self.worker_id = uuid.uuid4().hex
+        self.rooms: Dict[str, _RoomTyping] = {}
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._deliver: Optional[Callable[[str, str], Any]] = None
+        self._publish: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+        self.frames_sent = 0
+        self.updates_suppressed = 0
+
+    def start(self, deliver: Callable[[str, str], Any], publish: Callable[[Dict[str, Any]], Awaitable[None]]):
+        self._deliver = deliver
+        self._publish = publish
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def update(self, room_name: str, conn_id: int, username: str, is_typing: bool):
+        room = self.rooms.get(room_name)
+        if is_typing:
+            if room is None:
+                room = self.rooms[room_name] = _RoomTyping()
+            known = conn_id in room.local
+            room.local[conn_id] = (username, time.monotonic() + self.timeout)
+            if known:
+                self.updates_suppressed += 1
+                TYPING_UPDATES.labels("refreshed").inc()
+                return
+        elif room is None or room.local.pop(conn_id, None) is None:
+            self.updates_suppressed += 1
+            TYPING_UPDATES.labels("suppressed").inc()
+            return
+        TYPING_UPDATES.labels("changed").inc()
+        self._dirty.add(room_name)
+
+    def forget(self, room_name: str, conn_id: int):
+        room = self.rooms.get(room_name)
+        if room is not None and room.local.pop(conn_id, None) is not None:
+            self._dirty.add(room_name)
+
+    def merge_remote(self, event: Dict[str, Any]):
+        worker = event.get("worker")
+        if worker == self.worker_id:
+            return
+        room_name = event["room"]
+        users = tuple(event.get("typing") or ())
+        room = self.rooms.get(room_name)
+        if room is None:
+            if not users:
+                return
+            room = self.rooms[room_name] = _RoomTyping()
+        if users:
+            room.remote[worker] = (users, time.monotonic() + self.timeout)
+        else:
+            room.remote.pop(worker, None)
+        self._dirty.add(room_name)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.exception("Typing flush failed: %s", e)
+
+    async def _flush(self):
+        now = time.monotonic()
+        outgoing: List[Dict[str, Any]] = []
+        for room_name in list(self.rooms):
+            room = self.rooms[room_name]
+            expired = [conn_id for conn_id, (_, expires) in room.local.items() if expires <= now]
+            for conn_id in expired:
+                del room.local[conn_id]
+            stale = [worker for worker, (_, expires) in room.remote.items() if expires <= now]
+            for worker in stale:
+                del room.remote[worker]
+            if not (expired or stale or room_name in self._dirty):
+                if room.published and now - room.published_at >= self.timeout / 2:
+                    outgoing.append(self._published(room_name, room, now))
+                continue
+
+            local = room.local_names()
+            if local != room.published:
+                outgoing.append(self._published(room_name, room, now))
+            names = set(local)
+            for users, _ in room.remote.values():
+                names.update(users)
+            current = tuple(sorted(names))
+            if current != room.sent:
+                room.sent = current
+                self.frames_sent += 1
+                TYPING_FRAMES.inc()
+                self._deliver(room_name, json.dumps({"event": "typing", "users": list(current)}))
+            if not room.local and not room.remote and not room.sent:
+                del self.rooms[room_name]
+        self._dirty.clear()
+        for event in outgoing:
+            await self._publish(event)
+
+    def _published(self, room_name: str, room: _RoomTyping, now: float) -> Dict[str, Any]:
+        room.published = room.local_names()
+        room.published_at = now
+        return {"room": room_name, "typing": list(room.published), "worker": self.worker_id}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rooms": len(self.rooms),
+            "local_typists": sum(len(room.local) for room in self.rooms.values()),
+            "frames_sent": self.frames_sent,
+            "updates_suppressed": self.updates_suppressed,
+        }
@@ -1,75 +1,355 @@
+import asyncio
+import itertools
 import json
-from typing import Dict, List, Any, Optional
+import logging
+import time
+from typing import Dict, Iterator, List, Any, Optional, Set
 from fastapi import WebSocket
-from app.models.models import Message
+from app.core.config import TYPING_TICK_MS, TYPING_TIMEOUT, WS_OUTBOUND_QUEUE_SIZE
+from app.core.metrics import COUNT_BUCKETS, FAST_BUCKETS, registry as metrics
+from app.database.executor import run_db
+from app.models.models import Message, User
+from app.services.pubsub import BroadcastBackend, create_backend
+from app.services.typing_aggregator import TypingAggregator
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 1008
+# A message too large for the broadcast backend is published by id and read
+# back from the database; with async durability the row can still be in the
+# sender's write buffer, so a miss is retried after each of these delays.
+STORED_MESSAGE_RETRY_DELAYS = (0, 0.05, 0.25, 1.0, 2.0)
+
+FANOUT_SECONDS = metrics.histogram(
+    "ws_fanout_duration_seconds", "Time to queue one frame for every local member of a room", buckets=FAST_BUCKETS
+)
+FANOUT_RECIPIENTS = metrics.histogram(
+    "ws_fanout_recipients", "Local connections one frame was queued for", buckets=COUNT_BUCKETS
+)
+CLOSE_ERRORS = metrics.counter("ws_close_errors_total", "Errors closing a socket dropped as a slow consumer")
+STORED_MESSAGES = metrics.counter(
+    "ws_stored_messages_total", "Messages published by id and loaded by the receiving worker", ("outcome",)
+)
+
+def _load_message(db, message_id: int):
+    return (
+        db.query(Message, User.username)
+        .join(User, User.id == Message.sender_id)
+        .filter(Message.id == message_id)
+        .first()
+    )
+
+class Connection:
+    # One socket in a room. Frames are queued here and written by a dedicated
+    # task, so a slow client only ever delays itself.
+
+    __slots__ = ("conn_id", "room_name", "ws", "user_id", "username", "filter_enabled", "queue", "writer", "closed")
+
+    def __init__(
+        self,
+        conn_id: int,
+        room_name: str,
+        ws: WebSocket,
+        user_id: int,
+        username: str,
+        filter_enabled: bool,
+        queue_size: int,
+    ):
+        self.conn_id = conn_id
+        self.room_name = room_name
+        self.ws = ws
+        self.user_id = user_id
+        self.username = username
+        self.filter_enabled = filter_enabled
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+
+class Room:
+    # Connections keyed by id, plus secondary indexes by user and by filter
+    # setting. Every add/remove is O(1).
+
+    __slots__ = ("name", "conns", "by_user", "filtered")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.conns: Dict[int, Connection] = {}
+        self.by_user: Dict[int, Set[int]] = {}
+        self.filtered: Set[int] = set()
+
+    def add(self, conn: Connection):
+        self.conns[conn.conn_id] = conn
+        self.by_user.setdefault(conn.user_id, set()).add(conn.conn_id)
+        if conn.filter_enabled:
+            self.filtered.add(conn.conn_id)
+
+    def remove(self, conn: Connection):
+        if self.conns.pop(conn.conn_id, None) is None:
+            return
+        ids = self.by_user.get(conn.user_id)
+        if ids is not None:
+            ids.discard(conn.conn_id)
+            if not ids:
+                del self.by_user[conn.user_id]
+        self.filtered.discard(conn.conn_id)
+
+    def set_filter(self, conn: Connection, enabled: bool):
+        conn.filter_enabled = enabled
+        if enabled:
+            self.filtered.add(conn.conn_id)
+        else:
+            self.filtered.discard(conn.conn_id)
 
 class ConnectionManager:
 
-    def __init__(self):
-        self.active: Dict[str, List[Dict[str, Any]]] = {}
+    def __init__(self, queue_size: int = WS_OUTBOUND_QUEUE_SIZE, backend: Optional[BroadcastBackend] = None):
+        self.rooms: Dict[str, Room] = {}
+        self.backend = backend or create_backend()
+        self.typing = TypingAggregator(TYPING_TICK_MS, TYPING_TIMEOUT)
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self.connection_count = 0
+        self.frames_queued = 0
+        self.send_errors = 0
+        self.slow_consumer_disconnects = 0
+        self.frames_dropped = 0
+        self._loading: Set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.backend.start(self._deliver)
+        self.typing.start(lambda room_name, text: self._deliver({"room": room_name, "text": text}), self.backend.publish)
+
+    async def stop(self):
+        await self.typing.stop()
+        await self.backend.stop()
 
     async def connect(
         self, room_name: str, ws: WebSocket, user_id: int, username: str, filter_enabled: bool
-    ):
-        self.active.setdefault(room_name, []).append(
-            {"ws": ws, "user_id": user_id, "username": username, "filter_enabled": filter_enabled}
-        )
+    ) -> Connection:
+        conn = Connection(next(self._ids), room_name, ws, user_id, username, filter_enabled, self.queue_size)
+        conn.writer = asyncio.create_task(self._write_loop(conn))
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = Room(room_name)
+        room.add(conn)
+        self.connection_count += 1
+        return conn
 
-    def disconnect(self, room_name: str, ws: WebSocket):
-        conns = self.active.get(room_name, [])
-        self.active[room_name] = [c for c in conns if c["ws"] != ws]
-        if not self.active[room_name]:
-            del self.active[room_name]
+    def disconnect(self, conn: Connection):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.connection_count -= 1
+        self.typing.forget(conn.room_name, conn.conn_id)
+        self.frames_dropped += conn.queue.qsize()
+        room = self.rooms.get(conn.room_name)
+        if room is not None:
+            room.remove(conn)
+            if not room.conns:
+                del self.rooms[conn.room_name]
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
 
-    async def broadcast_message(
-        self, room_name: str, message_obj: Message, plaintext: Optional[str] = None
-    ):
+    def connections(self, room_name: str) -> Iterator[Connection]:
+        room = self.rooms.get(room_name)
+        return iter(room.conns.values()) if room else iter(())
 
-        conns = self.active.get(room_name, [])
-        out_common = {
-            "type": "message",
-            "id": message_obj.id,
-            "from_user_id": message_obj.sender_id,
-            "timestamp": message_obj.timestamp.isoformat(),
-            "is_toxic": bool(message_obj.is_toxic),
-            "prob": float(message_obj.toxicity_prob),
-        }
+    async def set_user_filter(self, room_name: str, user_id: int, enabled: bool):
+        self._apply_user_filter(room_name, user_id, enabled)
+        await self.backend.publish({"room": room_name, "user_id": user_id, "filter": enabled})
 
-        for conn in conns:
+    def _apply_user_filter(self, room_name: str, user_id: int, enabled: bool):
+        room = self.rooms.get(room_name)
+        if room is None:
+            return
+        for conn_id in list(room.by_user.get(user_id, ())):
+            conn = room.conns.get(conn_id)
+            if conn is not None:
+                room.set_filter(conn, enabled)
+
+    async def _write_loop(self, conn: Connection):
+        try:
+            while True:
+                text = await conn.queue.get()
+                await conn.ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.send_errors += 1
+            self.disconnect(conn)
+
+    async def _close_slow_consumer(self, conn: Connection):
+        try:
+            await conn.ws.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            CLOSE_ERRORS.inc()
+
+    def _enqueue(self, conn: Connection, text: str, overflowed: List[Connection]):
+        try:
+            conn.queue.put_nowait(text)
+            self.frames_queued += 1
+        except asyncio.QueueFull:
+            self.frames_dropped += 1
+            overflowed.append(conn)
+
+    def send(self, conn: Connection, text: str):
+        overflowed: List[Connection] = []
+        self._enqueue(conn, text, overflowed)
+        self._drop_slow(overflowed)
+
+    def _drop_slow(self, overflowed: List[Connection]):
+        # Removal is deferred until the fan-out loop is done so the room can
+        # be iterated in place rather than copied.
+        for conn in overflowed:
+            self.slow_consumer_disconnects += 1
+            self.disconnect(conn)
+            asyncio.create_task(self._close_slow_consumer(conn))
+
+    def _fan_out(self, room_name: str, text: str, exclude: Optional[Connection] = None) -> int:
+        room = self.rooms.get(room_name)
+        if room is None:
+            return 0
+        recipients = len(room.conns)
+        overflowed: List[Connection] = []
+        for conn in room.conns.values():
+            if conn is not exclude:
+                self._enqueue(conn, text, overflowed)
+            else:
+                recipients -= 1
+        self._drop_slow(overflowed)
+        return recipients
+
+    def _fan_out_filtered(self, room_name: str, visible: str, hidden: str) -> int:
+        room = self.rooms.get(room_name)
+        if room is None:
+            return 0
+        if not room.filtered:
+            return self._fan_out(room_name, visible)
+        recipients = len(room.conns)
+        overflowed: List[Connection] = []
+        for conn_id, conn in room.conns.items():
+            self._enqueue(conn, hidden if conn_id in room.filtered else visible, overflowed)
+        self._drop_slow(overflowed)
+        return recipients
+
+    def _deliver(self, event: Dict[str, Any], exclude: Optional[Connection] = None):
+        if "typing" in event:
+            # Another worker's typists; merged into this worker's next frame.
+            self.typing.merge_remote(event)
+            return
+        if "filter" in event:
+            self._apply_user_filter(event["room"], event["user_id"], event["filter"])
+            return
+        if "message_id" in event:
+            if event["room"] in self.rooms:
+                task = asyncio.get_running_loop().create_task(self._deliver_stored(event["room"], event["message_id"]))
+                self._loading.add(task)
+                task.add_done_callback(self._loading.discard)
+            return
+        start = time.perf_counter()
+        if event.get("hidden") is not None:
+            recipients = self._fan_out_filtered(event["room"], event["text"], event["hidden"])
+        else:
+            recipients = self._fan_out(event["room"], event["text"], exclude)
+        if recipients:
+            FANOUT_SECONDS.observe(time.perf_counter() - start)
+            FANOUT_RECIPIENTS.observe(recipients)
+
+    async def _deliver_stored(self, room_name: str, message_id: int):
+        for delay in STORED_MESSAGE_RETRY_DELAYS:
+            await asyncio.sleep(delay)
             try:
-                if message_obj.is_toxic and conn["filter_enabled"]:
-                    await conn["ws"].send_text(
-                        json.dumps(
-                            {
-                                "type": "message_hidden",
-                                "id": message_obj.id,
-                                "note": "Message hidden due to your filter setting.",
-                            }
-                        )
-                    )
-                else:
-                    await conn["ws"].send_text(
-                        json.dumps(
-                            {
-                                **out_common,
-                                "from_username": conn["username"],
-                                "from_user_id": message_obj.sender_id,
-                                "ciphertext": message_obj.ciphertext,
-                            }
-                        )
-                    )
-
-            except Exception:
-                pass
+                row = await run_db(_load_message, message_id)
+            except Exception as e:
+                STORED_MESSAGES.labels("error").inc()
+                logger.warning("Loading message %s for room %r failed: %s", message_id, room_name, e)
+                return
+            if row is not None:
+                STORED_MESSAGES.labels("delivered").inc()
+                visible, hidden = self._message_frames(row[0], row[1])
+                self._deliver({"room": room_name, "text": visible, "hidden": hidden})
+                return
+        STORED_MESSAGES.labels("missing").inc()
+        logger.warning("Message %s for room %r was never stored; not delivered here", message_id, room_name)
+
+    async def _publish(self, event: Dict[str, Any], exclude: Optional[Connection] = None):
+        # Local members get the frame right away; other workers via the backend.
+        self._deliver(event, exclude)
+        await self.backend.publish(event)
+
+    async def broadcast_message(
+        self,
+        room_name: str,
+        message_obj: Message,
+        plaintext: Optional[str] = None,
+        sender_username: Optional[str] = None,
+    ):
+        visible, hidden = self._message_frames(message_obj, sender_username)
+        event = {"room": room_name, "text": visible, "hidden": hidden}
+        self._deliver(event)
+        if not await self.backend.publish(event):
+            # Too large for the backend (a long ciphertext): other workers get
+            # the id and read the row back.
+            await self.backend.publish({"room": room_name, "message_id": message_obj.id})
+
+    def _message_frames(self, message_obj: Message, sender_username: Optional[str]):
+        # Each variant of the frame is serialized once, on the worker building it.
+        visible = json.dumps(
+            {
+                "type": "message",
+                "id": message_obj.id,
+                "from_user_id": message_obj.sender_id,
+                "from_username": sender_username,
+                "timestamp": message_obj.timestamp.isoformat(),
+                "is_toxic": bool(message_obj.is_toxic),
+                "prob": float(message_obj.toxicity_prob),
+                "model_version": message_obj.model_version,
+                "ciphertext": message_obj.ciphertext,
+            }
+        )
+        hidden = None
+        if message_obj.is_toxic:
+            hidden = json.dumps(
+                {
+                    "type": "message_hidden",
+                    "id": message_obj.id,
+                    "note": "Message hidden due to your filter setting.",
+                }
+            )
+        return visible, hidden
 
     async def broadcast_presence(self, room_name: str, username: str, status: str):
-        conns = self.active.get(room_name, [])
-        for conn in conns:
-            try:
-                await conn["ws"].send_text(
-                    json.dumps({"event": "presence", "user": username, "status": status})
-                )
-            except Exception:
-                pass
+        text = json.dumps({"event": "presence", "user": username, "status": status})
+        await self._publish({"room": room_name, "text": text})
+
+    def set_typing(self, sender: Connection, is_typing: bool):
+        self.typing.update(sender.room_name, sender.conn_id, sender.username, is_typing)
+
+    def clear_typing(self, sender: Connection):
+        self.typing.forget(sender.room_name, sender.conn_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rooms": len(self.rooms),
+            "connections": self.connection_count,
+            "frames_queued": self.frames_queued,
+            "send_errors": self.send_errors,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "frames_dropped": self.frames_dropped,
+            "typing": self.typing.stats(),
+            "broadcast": self.backend.stats(),
+        }
 
 manager = ConnectionManager()
+
+metrics.gauge_fn("ws_connections", "Open WebSocket connections on this worker", lambda: manager.connection_count)
+metrics.gauge_fn("ws_rooms", "Rooms with at least one connection on this worker", lambda: len(manager.rooms))
+metrics.counter_fn("ws_frames_queued_total", "Frames queued for sending", lambda: manager.frames_queued)
+metrics.counter_fn(
+    "ws_frames_dropped_total", "Frames never sent: queue full, or still queued at disconnect", lambda: manager.frames_dropped
+)
+metrics.counter_fn("ws_send_errors_total", "Failed socket writes; the connection is dropped", lambda: manager.send_errors)
+metrics.counter_fn(
+    "ws_slow_consumer_disconnects_total", "Connections dropped for a full outbound queue",
+    lambda: manager.slow_consumer_disconnects,
+)
@@ -1,28 +1,52 @@
+import logging
 import os, base64
 from fastapi import Depends, HTTPException, status, Header
 from jose import jwt, JWTError
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from app.core.config import ADMIN_USERNAMES
 from app.models.models import User, ChatRoom, RoomUserSetting
 from app.database.database import get_db
+from app.services.auth_cache import token_cache, token_key, get_cached_user, cache_user, user_cache
+from app.services.room_cache import RoomInfo, cache_room, get_cached_room, room_cache
+from app.services.room_directory import room_directory
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+def _verify_token(token: str):
+    key = token_key(token)
+    claims = token_cache.get(key)
+    if claims is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        claims = {"sub": payload.get("sub"), "uid": payload.get("uid"), "exp": payload.get("exp")}
+        token_cache.put(key, claims, claims["exp"])
+    return claims
+
 def get_user_from_token(token: str, db: Session):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        uid = payload.get("uid")
+        claims = _verify_token(token)
+        sub = claims["sub"]
+        uid = claims["uid"]
         if not sub and not uid:
             return None
     except JWTError as e:
-        print("JWT decode error:", e)
+        logger.debug("JWT decode error: %s", e)
         return None
 
     user = None
     if uid and str(uid).isdigit():
-        user = db.query(User).filter(User.id == int(uid)).first()
+        user = get_cached_user(int(uid))
+        if user is None:
+            generation = user_cache.generation
+            user = db.query(User).filter(User.id == int(uid)).first()
+            if user:
+                cache_user(user, claims["exp"], generation)
     elif sub:
         user = db.query(User).filter(User.username == sub).first()
     return user
@@ -44,20 +68,79 @@ async def get_current_user(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token or user not found")
     return user
 
-def get_or_create_chatroom(db: Session, chat_id: str) -> ChatRoom:
-    room = db.query(ChatRoom).filter_by(name=chat_id).first()
-    if not room:
-        key = base64.b64encode(os.urandom(32)).decode()
-        room = ChatRoom(name=chat_id, symmetric_key=key)
-        db.add(room)
-        db.commit()
-        db.refresh(room)
-        print(f"Created new chatroom: {chat_id}")
-    elif not room.symmetric_key:
-        room.symmetric_key = base64.b64encode(os.urandom(32)).decode()
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+def _new_room_key() -> str:
+    return base64.b64encode(os.urandom(32)).decode()
+
+def upsert_chatroom(db: Session, name: str, key: str, update_missing_key: bool = True) -> Optional[RoomInfo]:
+    # One INSERT ... ON CONFLICT (name), so concurrent creators of the same
+    # room never trip the unique constraint. With update_missing_key the
+    # existing row is returned (filling in a missing key); without it a
+    # conflict returns None.
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return _create_chatroom_fallback(db, name, key, update_missing_key)
+
+    table = ChatRoom.__table__
+    stmt = insert(table).values(name=name, symmetric_key=key)
+    if update_missing_key:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"symmetric_key": func.coalesce(table.c.symmetric_key, stmt.excluded.symmetric_key)},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.name])
+    row = db.execute(stmt.returning(table.c.id, table.c.name, table.c.symmetric_key)).first()
+    db.commit()
+    # Core inserts skip the ORM events the directory listens for.
+    if row:
+        room_directory.apply([("room", row.id, row.name)])
+    return RoomInfo(*row) if row else None
+
+def _create_chatroom_fallback(db: Session, name: str, key: str, update_missing_key: bool) -> Optional[RoomInfo]:
+    room = ChatRoom(name=name, symmetric_key=key)
+    db.add(room)
+    try:
         db.commit()
+    except IntegrityError:
+        db.rollback()
+        if not update_missing_key:
+            return None
+        room = db.query(ChatRoom).filter_by(name=name).first()
+        if not room.symmetric_key:
+            room.symmetric_key = key
+            db.commit()
+    return RoomInfo(room.id, room.name, room.symmetric_key)
+
+def get_chatroom(db: Session, chat_id: str) -> Optional[RoomInfo]:
+    room = get_cached_room(chat_id)
+    if room is None:
+        generation = room_cache.generation
+        row = db.query(ChatRoom).filter_by(name=chat_id).first()
+        if row:
+            room = cache_room(row, generation)
     return room
 
+def get_or_create_chatroom(db: Session, chat_id: str) -> RoomInfo:
+    room = get_chatroom(db, chat_id)
+    if room is None or not room.symmetric_key:
+        room = upsert_chatroom(db, chat_id, _new_room_key())
+        logger.info("Created new chatroom: %s", chat_id)
+        cache_room(room)
+    return room
+
+def get_room_filter_enabled(db: Session, user_id: int, room_id: int) -> bool:
+    setting = db.query(RoomUserSetting).filter_by(user_id=user_id, room_id=room_id).first()
+    return bool(setting.filter_enabled) if setting else False
+
 def get_or_create_room_user_setting(db: Session, user_id: int, room_id: int) -> RoomUserSetting:
     setting = db.query(RoomUserSetting).filter_by(user_id=user_id, room_id=room_id).first()
     if not setting:
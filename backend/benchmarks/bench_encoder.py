@@ -0,0 +1,102 @@
+"""Agreement and speed of the SBERT encoder backends against the torch reference.
+
+Run from backend/:  python -m benchmarks.bench_encoder --backends torch,onnx-int8
+
+Scores a fixed sample with each backend through the same classifier and
+reports, relative to --reference: probability drift, the share of messages
+whose toxic/clean decision flips at the threshold, and embedding cosine
+similarity. Then single-message latency (p50/p99) and batch throughput.
+--csv takes the sample from a file with a `text` column instead of the
+built-in one.
+"""
+import argparse
+import time
+from app.services import encoders
+from app.services.model_registry import CLF_PATH, ENC_DIR, THRESH_PATH, read_threshold
+from app.services.toxicity import clean_text
+from benchmarks.common import csv_texts, percentile, sample_texts
+
+def _encode_all(encoder, texts, batch_size):
+    import numpy as np
+
+    return np.vstack([encoder.encode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--encoder-dir", default=ENC_DIR)
+    parser.add_argument("--classifier", default=CLF_PATH)
+    parser.add_argument("--threshold", type=float, default=None, help=f"default: {THRESH_PATH}")
+    parser.add_argument("--backends", default=",".join(encoders.BACKENDS))
+    parser.add_argument("--reference", default=encoders.BACKEND_TORCH)
+    parser.add_argument("--csv", help="sample texts from this CSV's text column")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--single", type=int, default=200, help="messages timed one at a time")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import joblib
+    import numpy as np
+
+    texts = [clean_text(t) for t in (csv_texts(args.csv, args.samples) if args.csv else sample_texts(args.samples))]
+    clf = joblib.load(args.classifier)
+    threshold = args.threshold if args.threshold is not None else read_threshold(THRESH_PATH)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if args.reference not in backends:
+        backends.insert(0, args.reference)
+
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        encoder = encoders.load_encoder(args.encoder_dir, backend)
+        load_s = time.perf_counter() - start
+        if encoder.backend != backend:
+            print(f"{backend}: unavailable, load_encoder fell back to {encoder.backend}; skipped")
+            continue
+
+        encoder.encode(texts[:args.batch_size])  # warm-up
+        emb = _encode_all(encoder, texts, args.batch_size)
+
+        single_ms = []
+        for text in texts[:args.single]:
+            t0 = time.perf_counter()
+            encoder.encode([text])
+            single_ms.append((time.perf_counter() - t0) * 1000)
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            _encode_all(encoder, texts, args.batch_size)
+            best = min(best, time.perf_counter() - t0)
+
+        results[backend] = {
+            "emb": emb,
+            "probs": clf.predict_proba(emb)[:, 1],
+            "load_s": load_s,
+            "p50": percentile(single_ms, 50),
+            "p99": percentile(single_ms, 99),
+            "throughput": len(texts) / best,
+        }
+
+    reference = results.get(args.reference)
+    if reference is None:
+        raise SystemExit(f"Reference backend {args.reference} could not be loaded")
+    ref_probs, ref_pred = reference["probs"], reference["probs"] >= threshold
+
+    print(
+        f"{len(texts)} texts, threshold={threshold}, batch_size={args.batch_size}, "
+        f"reference={args.reference}, best of {args.repeat}"
+    )
+    print(f"  {'backend':<10} {'mean|dp|':>9} {'max|dp|':>9} {'flips':>8} {'cos min':>8}   "
+          f"{'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'texts/s':>9}")
+    for backend, r in results.items():
+        drift = np.abs(r["probs"] - ref_probs)
+        flips = np.mean((r["probs"] >= threshold) != ref_pred)
+        cosine = np.sum(r["emb"] * reference["emb"], axis=1)
+        print(
+            f"  {backend:<10} {drift.mean():>9.5f} {drift.max():>9.5f} {flips:>8.2%} {cosine.min():>8.5f}   "
+            f"{r['load_s']:>7.2f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['throughput']:>9.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
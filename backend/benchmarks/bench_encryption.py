@@ -0,0 +1,54 @@
+"""Serial vs bulk AES-CBC micro-benchmark for app.services.encryption.
+
+Run from backend/:  python -m benchmarks.bench_encryption --messages 5000
+"""
+import argparse
+import base64
+import os
+import time
+from app.services import encryption
+
+def _best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=256, help="plaintext length in characters")
+    parser.add_argument("--chunk-size", type=int, default=encryption.ENCRYPTION_CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    key = base64.b64encode(os.urandom(32)).decode()
+    plaintexts = ["x" * args.size for _ in range(args.messages)]
+    ciphertexts = [encryption.encrypt_message(key, p) for p in plaintexts]
+
+    def serial_decrypt():
+        for c in ciphertexts:
+            encryption.decrypt_message(key, c)
+
+    def serial_encrypt():
+        for p in plaintexts:
+            encryption.encrypt_message(key, p)
+
+    results = [
+        ("decrypt serial", _best_of(args.repeat, serial_decrypt)),
+        ("decrypt bulk", _best_of(args.repeat, lambda: encryption.decrypt_many(key, ciphertexts, args.chunk_size))),
+        ("encrypt serial", _best_of(args.repeat, serial_encrypt)),
+        ("encrypt bulk", _best_of(args.repeat, lambda: encryption.encrypt_many(key, plaintexts, args.chunk_size))),
+    ]
+
+    print(
+        f"{args.messages} messages x {args.size} chars, chunk_size={args.chunk_size}, "
+        f"workers={encryption.ENCRYPTION_WORKERS}, cpus={os.cpu_count()}, best of {args.repeat}"
+    )
+    for name, seconds in results:
+        print(f"  {name:<16} {seconds * 1000:9.2f} ms  {args.messages / seconds:12.0f} msg/s")
+
+if __name__ == "__main__":
+    main()
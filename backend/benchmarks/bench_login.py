@@ -0,0 +1,87 @@
+"""Login throughput and its effect on other routes, against a running server.
+
+Start the API first (uvicorn app.main:app), then from backend/:
+    python -m benchmarks.bench_login --url http://127.0.0.1:8000 --concurrency 32
+
+Drives concurrent /auth/login calls for --duration seconds while a probe loop
+hits /rooms and /chat/{room}/history, and reports logins/s, 503s and latency
+percentiles for both. Needs httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+from benchmarks.common import percentile
+
+def _report(name, latencies, elapsed, extra=""):
+    ms = [s * 1000 for s in latencies]
+    print(
+        f"{name:<10} {len(ms):>7} req  {len(ms) / elapsed:>8.1f}/s  "
+        f"p50 {percentile(ms, 50):>8.1f} ms  p99 {percentile(ms, 99):>8.1f} ms  "
+        f"max {max(ms, default=0.0):>8.1f} ms{extra}"
+    )
+
+async def _login_worker(client, username, password, deadline, latencies, statuses):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        resp = await client.post("/auth/login", params={"username": username, "password": password})
+        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        if resp.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+
+async def _probe(client, token, room, deadline, latencies):
+    headers = {"Authorization": f"Bearer {token}"}
+    paths = ["/rooms", f"/chat/{room}/history"]
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(paths[i % len(paths)], headers=headers)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+        await asyncio.sleep(0.01)
+
+async def run(args):
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    password = "bench-password"
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        resp = await client.post("/auth/register", params={"username": username, "password": password})
+        resp.raise_for_status()
+        resp = await client.post("/auth/login", params={"username": username, "password": password})
+        resp.raise_for_status()
+        token = resp.json()["access_token"]
+        room = f"bench-{uuid.uuid4().hex[:8]}"
+        await client.get(f"/chat/{room}/key", headers={"Authorization": f"Bearer {token}"})
+
+        # Baseline: the probe alone.
+        baseline = []
+        start = time.perf_counter()
+        await _probe(client, token, room, start + args.baseline, baseline)
+        _report("idle probe", baseline, time.perf_counter() - start)
+
+        logins, probes, statuses = [], [], {}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            _probe(client, token, room, deadline, probes),
+            *(
+                _login_worker(client, username, password, deadline, logins, statuses)
+                for _ in range(args.concurrency)
+            ),
+        )
+        elapsed = time.perf_counter() - start
+        _report("login", logins, elapsed, f"  statuses {dict(sorted(statuses.items()))}")
+        _report("probe", probes, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel login loops")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of login load")
+    parser.add_argument("--baseline", type=float, default=2.0, help="seconds of probe-only warm-up")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
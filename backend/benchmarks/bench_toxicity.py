@@ -0,0 +1,170 @@
+"""Offline benchmark of clean_text + predict_toxicity, with a regression budget.
+
+Run from backend/:
+    python -m benchmarks.bench_toxicity --output before.json
+    python -m benchmarks.bench_toxicity --output after.json --baseline before.json --budget 0.10
+
+Uses the model the registry would serve (or --version), or the deterministic
+stub from benchmarks.stub_model with --stub or when no model can be loaded.
+Reports cold-start load time, single-message p50/p95/p99, throughput at each
+--batch-sizes, clean_text cost and peak RSS, and writes them as JSON. With
+--baseline, exits with status 1 if any metric is worse than the baseline's by
+more than --budget (a fraction). The result cache is off unless --cache, so
+every call reaches the model.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+# Latency-like metrics regress upwards, throughput downwards.
+_HIGHER_IS_WORSE = ("cold_start.load_s", "cold_start.first_predict_ms", "single_ms.p50",
+                    "single_ms.p95", "single_ms.p99", "single_ms.mean", "clean_text_us", "peak_rss_mb")
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _flatten(result):
+    flat = {}
+    for section in ("cold_start", "single_ms", "throughput"):
+        for name, value in result[section].items():
+            flat[f"{section}.{name}"] = value
+    flat["clean_text_us"] = result["clean_text_us"]
+    flat["peak_rss_mb"] = result["peak_rss_mb"]
+    return flat
+
+def check_budget(result, baseline, budget):
+    # Regressions beyond budget, as printable lines; empty when within it.
+    if baseline["meta"]["model_version"] != result["meta"]["model_version"]:
+        print(
+            f"note: comparing model {result['meta']['model_version']} "
+            f"against baseline model {baseline['meta']['model_version']}"
+        )
+    current, previous = _flatten(result), _flatten(baseline)
+    failures = []
+    for name, old in previous.items():
+        new = current.get(name)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = change if (name in _HIGHER_IS_WORSE) else -change
+        if worse > budget:
+            failures.append(f"{name}: {old} -> {new} ({change:+.1%}, budget {budget:.0%})")
+    return failures
+
+def _load(args):
+    from app.services.model_registry import registry
+    from benchmarks import stub_model
+
+    start = time.perf_counter()
+    model = None
+    if not args.stub:
+        if args.version:
+            model = registry.load(args.version)
+            registry.serve(model)
+        else:
+            model = registry.current()
+    if model is None:
+        if not args.stub:
+            print("No toxicity model could be loaded; using the deterministic stub")
+        model = stub_model.install()
+    return model, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use the stub model even if a real one exists")
+    parser.add_argument("--version", help="registry version to benchmark instead of the active one")
+    parser.add_argument("--csv", help="sample texts from this CSV's text column")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--single", type=int, default=500, help="messages timed one at a time")
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="keep the toxicity result cache on")
+    parser.add_argument("--output", help="write the JSON result here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare against")
+    parser.add_argument("--budget", type=float, default=0.10, help="allowed regression per metric, as a fraction")
+    args = parser.parse_args()
+
+    # Timed before anything else imports the model's dependencies.
+    model, load_s = _load(args)
+
+    from app.services import toxicity
+    from app.services.toxicity_cache import toxicity_cache
+    from benchmarks.common import csv_texts, percentile, sample_texts
+
+    if not args.cache:
+        toxicity_cache.max_entries = 0
+    texts = csv_texts(args.csv, args.samples) if args.csv else sample_texts(args.samples)
+
+    start = time.perf_counter()
+    toxicity.predict_toxicity(texts[0])
+    first_ms = (time.perf_counter() - start) * 1000
+
+    single = []
+    for text in texts[:args.single]:
+        start = time.perf_counter()
+        toxicity.predict_toxicity(text)
+        single.append((time.perf_counter() - start) * 1000)
+
+    throughput = {}
+    for size in [int(s) for s in args.batch_sizes.split(",") if s.strip()]:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for i in range(0, len(texts), size):
+                toxicity.predict_toxicity_batch(texts[i:i + size])
+            best = min(best, time.perf_counter() - start)
+        throughput[str(size)] = round(len(texts) / best, 1)
+
+    start = time.perf_counter()
+    for text in texts:
+        toxicity.clean_text(text)
+    clean_us = (time.perf_counter() - start) / len(texts) * 1e6
+
+    result = {
+        "meta": {
+            "model_version": model.version,
+            "model_kind": model.kind,
+            "backend": model.backend,
+            "samples": len(texts),
+            "cache": args.cache,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "created_at": time.time(),
+        },
+        "cold_start": {"load_s": round(load_s, 3), "first_predict_ms": round(first_ms, 3)},
+        "single_ms": {
+            "p50": round(percentile(single, 50), 3),
+            "p95": round(percentile(single, 95), 3),
+            "p99": round(percentile(single, 99), 3),
+            "mean": round(sum(single) / len(single), 3),
+        },
+        "throughput": throughput,
+        "clean_text_us": round(clean_us, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+    body = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(body)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            failures = check_budget(result, json.load(f), args.budget)
+        for line in failures:
+            print(f"REGRESSION {line}")
+        if failures:
+            sys.exit(1)
+        print(f"Within budget ({args.budget:.0%}) of {args.baseline}")
+
+if __name__ == "__main__":
+    main()
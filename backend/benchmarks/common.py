@@ -0,0 +1,26 @@
+"""Helpers shared by the benchmarks: fixed text samples and percentiles."""
+import csv
+import random
+
+_OPENERS = ["you are", "this is", "that was", "honestly", "lol", "why is everyone so", "i think you're"]
+_WORDS = [
+    "great", "kind", "helpful", "a legend", "so funny", "brilliant", "wrong but fine",
+    "an idiot", "stupid", "a moron", "trash", "pathetic", "useless", "disgusting",
+]
+_TAILS = ["", "!", " today", " as always", " tbh", " and everyone knows it", " https://example.com/x"]
+
+def sample_texts(size, seed=0):
+    # Chat-like messages, the same list for the same (size, seed).
+    rng = random.Random(seed)
+    return [f"{rng.choice(_OPENERS)} {rng.choice(_WORDS)}{rng.choice(_TAILS)}" for _ in range(size)]
+
+def csv_texts(path, size):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["text"] for row, _ in zip(csv.DictReader(f), range(size))]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
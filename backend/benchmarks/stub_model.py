@@ -0,0 +1,52 @@
+"""Deterministic stand-in for the toxicity model, for runs without the real one.
+
+Hashes words and character trigrams into a fixed-size embedding and scores it
+with fixed logistic weights, so results are identical across runs and
+machines. The cost is nowhere near SBERT's: numbers measured with the stub
+describe the pipeline around the model, not the model.
+"""
+import hashlib
+from app.services.model_registry import LoadedModel, registry
+
+STUB_VERSION = "stub"
+DIM = 384
+_TOXIC = ("idiot", "stupid", "moron", "trash", "pathetic", "useless", "disgusting", "hate")
+
+def _bucket(token):
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % DIM
+
+class StubEncoder:
+    backend = "stub"
+
+    def encode(self, texts):
+        import numpy as np
+
+        emb = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                emb[row, _bucket(word)] += 1.0
+            padded = f" {text} "
+            for i in range(len(padded) - 2):
+                emb[row, _bucket(padded[i:i + 3])] += 0.25
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        return emb / np.clip(norms, 1e-12, None)
+
+def stub_model():
+    import numpy as np
+
+    encoder = StubEncoder()
+    weights = np.random.RandomState(0).normal(0, 0.5, DIM).astype(np.float32)
+    for word in _TOXIC:
+        weights[_bucket(word)] = 8.0
+
+    def score(texts):
+        return 1.0 / (1.0 + np.exp(-(encoder.encode(texts) @ weights - 1.0)))
+
+    return LoadedModel(STUB_VERSION, "stub", 0.5, score, encoder.backend)
+
+def install():
+    # Serve the stub from the process-wide registry.
+    model = stub_model()
+    registry.serve(model)
+    return model
@@ -0,0 +1,356 @@
+"""WebSocket load generator: N rooms x M clients chatting through /chat/ws/{room}.
+
+Run from backend/:
+    python -m benchmarks.ws_load --rooms 4 --clients 8 --rate 2 --duration 10
+    python -m benchmarks.ws_load --database-url postgresql://... --output run.json
+    python -m benchmarks.ws_load --url http://127.0.0.1:8000 --server-pid 1234
+    python -m benchmarks.ws_load --scenarios scenarios.json --output capacity.json
+
+Without --url the app runs in this process on the same event loop as the
+clients, against --database-url (default: a throwaway SQLite file) and the
+stub toxicity model from benchmarks.stub_model. Each client sends encrypted
+messages at --rate per second (Poisson arrivals), preceded by a typing event
+with probability --typing. The typing event goes out 1.5 TYPING_TICK_MS ticks
+(read from this process's environment) before its message, which waits that
+long if its gap was shorter: the server coalesces typing into one frame per
+room per tick, and the message clears the typist again. Reported per scenario: end-to-end delivery latency
+percentiles, messages and deliveries per second, the delivery ratio, messages
+refused by the server's rate limits, fan-out cost per member (spread between a
+message's first and last delivery, divided by the other members), the typing
+frames received and RSS per connection. In-process, RSS covers both the server and the clients; with --url
+it is read from --server-pid.
+
+--scenarios is a JSON list of objects overriding name, rooms, clients, rate,
+duration, typing and drain for consecutive runs. Results are JSON, one object per
+scenario.
+
+Needs httpx and websockets (pip install httpx websockets; websockets also
+comes with uvicorn[standard]).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+SCENARIO_KEYS = ("name", "rooms", "clients", "rate", "duration", "typing", "drain")
+
+def _rss_kb(pid="self"):
+    # Current (not peak) resident set size from /proc; None where unavailable.
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _start_in_process(args):
+    # Configured through the environment, so it has to happen before the app
+    # (and its config module) is imported.
+    if not args.database_url:
+        fd, path = tempfile.mkstemp(prefix="ws_load-", suffix=".db")
+        os.close(fd)
+        args.database_url = f"sqlite:///{path}"
+        args.scratch_db = path
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["TOXICITY_WARMUP"] = "false"
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+    import uvicorn
+    from app.main import app
+    from benchmarks import stub_model
+
+    stub_model.install()
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=1 << 20))
+    task = asyncio.get_running_loop().create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, task
+
+async def _register(client, username, password):
+    # The password hasher sheds load with 503 + Retry-After; honour it.
+    for path in ("/auth/register", "/auth/login"):
+        while True:
+            resp = await client.post(path, params={"username": username, "password": password})
+            if resp.status_code != 503:
+                break
+            await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+        resp.raise_for_status()
+    return resp.json()["access_token"]
+
+class Scenario:
+    # Counters and samples of one run, shared by all of its clients. Sending
+    # starts once every client is connected (started) and stops at deadline.
+
+    def __init__(self, config):
+        self.config = config
+        self.sent = {}  # ciphertext -> (send time, members of its room)
+        self.receipts = {}  # ciphertext -> delivery times
+        self.latencies_ms = []
+        self.typing_sent = 0
+        self.typing_frames = 0
+        self.typing_frames_with_users = 0
+        self.rate_limited = 0
+        self.closes = {}
+        self.members = {}
+        self.connected = 0
+        self.started = asyncio.Event()
+        self.deadline = 0.0
+
+    def record_close(self, code):
+        self.closes[str(code)] = self.closes.get(str(code), 0) + 1
+
+    def on_frame(self, raw, now):
+        frame = json.loads(raw)
+        if frame.get("type") == "message":
+            sent = self.sent.get(frame.get("ciphertext"))
+            if sent is not None:
+                self.latencies_ms.append((now - sent[0]) * 1000)
+                self.receipts.setdefault(frame["ciphertext"], []).append(now)
+        elif frame.get("type") == "rate_limited":
+            self.rate_limited += 1
+        elif frame.get("event") == "typing":
+            self.typing_frames += 1
+            if frame.get("users"):
+                self.typing_frames_with_users += 1
+
+async def _client(ws_url, token, room, key, scenario):
+    import websockets
+    from app.core.config import TYPING_TICK_MS
+    from app.services.encryption import encrypt_message
+
+    rate, typing = scenario.config["rate"], scenario.config["typing"]
+    typing_lead = 1.5 * TYPING_TICK_MS / 1000
+    try:
+        async with websockets.connect(f"{ws_url}/chat/ws/{room}?token={token}", max_size=None, ping_interval=None) as ws:
+            scenario.members[room] = scenario.members.get(room, 0) + 1
+            scenario.connected += 1
+
+            async def receive():
+                async for raw in ws:
+                    scenario.on_frame(raw, time.perf_counter())
+
+            receiver = asyncio.get_running_loop().create_task(receive())
+            try:
+                await scenario.started.wait()
+                # Staggered start, then Poisson arrivals.
+                gap = random.random() / rate
+                seq = 0
+                while True:
+                    if random.random() < typing:
+                        # Long enough before the message for a tick to report it.
+                        await asyncio.sleep(max(0.0, gap - typing_lead))
+                        if time.perf_counter() >= scenario.deadline:
+                            break
+                        await ws.send(json.dumps({"event": "typing", "is_typing": True}))
+                        scenario.typing_sent += 1
+                        await asyncio.sleep(typing_lead)
+                    else:
+                        await asyncio.sleep(gap)
+                    if time.perf_counter() >= scenario.deadline:
+                        break
+                    seq += 1
+                    cipher = encrypt_message(key, f"load {seq} from a client in {room}")
+                    scenario.sent[cipher] = (time.perf_counter(), scenario.members[room])
+                    await ws.send(json.dumps({"ciphertext": cipher}))
+                    gap = random.expovariate(rate)
+                # Let in-flight deliveries land before closing.
+                await asyncio.sleep(scenario.config["drain"])
+            finally:
+                receiver.cancel()
+            scenario.record_close(1000)
+    except Exception as e:
+        close = getattr(e, "rcvd", None)
+        scenario.record_close(close.code if close is not None else type(e).__name__)
+
+async def run_scenario(client, base_url, config, server_pid):
+    from benchmarks.common import percentile
+
+    rooms = [f"load-{uuid.uuid4().hex[:6]}-{i}" for i in range(config["rooms"])]
+    total = config["rooms"] * config["clients"]
+
+    # Accounts and room keys first; none of it is measured.
+    semaphore = asyncio.Semaphore(8)
+
+    async def account():
+        async with semaphore:
+            return await _register(client, f"load_{uuid.uuid4().hex[:10]}", "load-password")
+
+    tokens = await asyncio.gather(*(account() for _ in range(total)))
+    keys = {}
+    for room in rooms:
+        resp = await client.get(f"/chat/{room}/key", headers={"Authorization": f"Bearer {tokens[0]}"})
+        resp.raise_for_status()
+        keys[room] = resp.json()["symmetric_key"]
+
+    scenario = Scenario(config)
+    ws_url = "ws" + base_url[len("http"):]
+    rss_before = _rss_kb(server_pid)
+    connect_start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    tasks = [
+        loop.create_task(_client(ws_url, tokens[i], rooms[i % len(rooms)], keys[rooms[i % len(rooms)]], scenario))
+        for i in range(total)
+    ]
+    while scenario.connected + sum(t.done() for t in tasks) < total:
+        await asyncio.sleep(0.02)
+    connect_s = time.perf_counter() - connect_start
+    await asyncio.sleep(0.5)
+    rss_after = _rss_kb(server_pid)
+
+    start = time.perf_counter()
+    scenario.deadline = start + config["duration"]
+    scenario.started.set()
+    await asyncio.gather(*tasks)
+    elapsed = min(time.perf_counter() - start, config["duration"] + config["drain"])
+
+    messages = len(scenario.sent)
+    expected = sum(members for _, members in scenario.sent.values())
+    lat = scenario.latencies_ms
+    spreads = [
+        (max(times) - min(times)) / (len(times) - 1) * 1e6
+        for times in scenario.receipts.values()
+        if len(times) > 1
+    ]
+    per_conn = None
+    if rss_before is not None and rss_after is not None and scenario.connected:
+        per_conn = round((rss_after - rss_before) / scenario.connected, 1)
+    return {
+        "scenario": config,
+        "connections": scenario.connected,
+        "connect_s": round(connect_s, 3),
+        "messages": messages,
+        "messages_per_s": round(messages / config["duration"], 1),
+        "deliveries": len(lat),
+        "deliveries_per_s": round(len(lat) / elapsed, 1),
+        "delivery_ratio": round(len(lat) / expected, 4) if expected else None,
+        "latency_ms": {
+            "p50": round(percentile(lat, 50), 3),
+            "p95": round(percentile(lat, 95), 3),
+            "p99": round(percentile(lat, 99), 3),
+            "max": round(max(lat, default=0.0), 3),
+        },
+        "fanout_us_per_member": {
+            "p50": round(percentile(spreads, 50), 1),
+            "p95": round(percentile(spreads, 95), 1),
+        },
+        "typing": {
+            "sent": scenario.typing_sent,
+            "frames": scenario.typing_frames,
+            "frames_with_users": scenario.typing_frames_with_users,
+        },
+        "rate_limited": scenario.rate_limited,
+        "rss_kb_per_connection": per_conn,
+        "closes": scenario.closes,
+    }
+
+def _scenarios(args):
+    base = {
+        "name": "default",
+        "rooms": args.rooms,
+        "clients": args.clients,
+        "rate": args.rate,
+        "duration": args.duration,
+        "typing": args.typing,
+        "drain": args.drain,
+    }
+    scenarios = [base]
+    if args.scenarios:
+        with open(args.scenarios, "r") as f:
+            overrides = json.load(f)
+        scenarios = []
+        for i, override in enumerate(overrides):
+            unknown = set(override) - set(SCENARIO_KEYS)
+            if unknown:
+                raise SystemExit(f"Scenario {i}: unknown keys {sorted(unknown)} (allowed: {', '.join(SCENARIO_KEYS)})")
+            scenarios.append({**base, "name": f"scenario-{i}", **override})
+    for scenario in scenarios:
+        if scenario["rate"] <= 0 or scenario["rooms"] < 1 or scenario["clients"] < 1:
+            raise SystemExit(f"{scenario['name']}: rate, rooms and clients must be positive")
+    return scenarios
+
+async def run(args):
+    import httpx
+
+    server = task = None
+    server_pid = args.server_pid
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        base_url, server, task = await _start_in_process(args)
+        server_pid = "self"
+
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            for config in _scenarios(args):
+                result = await run_scenario(client, base_url, config, server_pid)
+                lat = result["latency_ms"]
+                print(
+                    f"{config['name']}: {config['rooms']}x{config['clients']} @ {config['rate']}/s  "
+                    f"{result['messages_per_s']} msg/s  {result['deliveries_per_s']} deliveries/s  "
+                    f"ratio {result['delivery_ratio']}  p50 {lat['p50']} ms  p99 {lat['p99']} ms  "
+                    f"rss/conn {result['rss_kb_per_connection']} KiB",
+                    file=sys.stderr,
+                )
+                if result["typing"]["sent"] and not result["typing"]["frames_with_users"]:
+                    print(
+                        f"{config['name']}: warning: {result['typing']['sent']} typing events sent but no "
+                        "typing frame listed anyone; the server's TYPING_TICK_MS may be longer than this one's",
+                        file=sys.stderr,
+                    )
+                results.append(result)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+        scratch_db = getattr(args, "scratch_db", None)
+        if scratch_db:
+            os.remove(scratch_db)
+
+    meta = {
+        "target": args.url or "in-process",
+        "database": None if args.url else args.database_url.split("@")[-1],
+        "cpus": os.cpu_count(),
+        "created_at": time.time(),
+    }
+    return {"meta": meta, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="a running server; default: run the app in this process")
+    parser.add_argument("--server-pid", help="with --url: the server process, to report its RSS per connection")
+    parser.add_argument("--database-url", help="in-process database (default: a temporary SQLite file)")
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8, help="clients per room")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per client")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--typing", type=float, default=0.5, help="chance a message is preceded by a typing event")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for deliveries after sending")
+    parser.add_argument("--scenarios", help="JSON list of scenario overrides to run in sequence")
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(body)
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ export default function RoomList({ token, onSelectRoom }) {
   const load = async () => {
     try {
       const res = await api.get("/rooms");
-      setRooms(res.data || []);
+      setRooms(res.data?.rooms || []);
     } catch (e) {
       console.warn("failed to load rooms", e);
     }
@@ -9,12 +9,19 @@ export default function RoomsPanel({ onSelectRoom }) {
   const [loading, setLoading] = useState(false);
   const [creating, setCreating] = useState(false);
   const [newRoomName, setNewRoomName] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const loadRooms = async () => {
+  // Search runs on the server, one page at a time; pass the cursor to append the next page.
+  const loadRooms = async (query = search, cursor = null) => {
     setLoading(true);
     try {
-      const res = await api.get("/rooms", { headers: { Authorization: `Bearer ${token}` } });
-      setRooms(res.data || []);
+      const res = await api.get("/rooms", {
+        params: { search: query || undefined, cursor: cursor || undefined },
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      const page = res.data?.rooms || [];
+      setRooms((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(res.data?.next_cursor || null);
     } catch (err) {
       console.error("Failed to load rooms", err);
     } finally {
@@ -23,8 +30,9 @@ export default function RoomsPanel({ onSelectRoom }) {
   };
 
   useEffect(() => {
-    loadRooms();
-  }, []);
+    const timer = setTimeout(() => loadRooms(search), 250);
+    return () => clearTimeout(timer);
+  }, [search]);
 
   const handleCreateRoom = async () => {
     if (!newRoomName.trim()) return;
@@ -55,8 +63,6 @@ export default function RoomsPanel({ onSelectRoom }) {
     onSelectRoom(room.name);
   };
 
-  const filtered = rooms.filter((r) => r.name.toLowerCase().includes(search.toLowerCase()));
-
   return (
     <div className="p-4 h-full flex flex-col gap-3 panel">
       <div className="mb-1">
@@ -85,10 +91,10 @@ export default function RoomsPanel({ onSelectRoom }) {
         </button>
       </div>
 
-      <div className="text-xs text-gray-400 mb-2">{loading ? "Loading rooms..." : `${filtered.length} rooms`}</div>
+      <div className="text-xs text-gray-400 mb-2">{loading ? "Loading rooms..." : `${rooms.length}${nextCursor ? "+" : ""} rooms`}</div>
 
       <div className="overflow-y-auto flex-1 space-y-2">
-        {filtered.map((room) => (
+        {rooms.map((room) => (
           <button
             key={room.id}
             onClick={() => handleClickRoom(room)}
@@ -103,7 +109,17 @@ export default function RoomsPanel({ onSelectRoom }) {
           </button>
         ))}
 
-        {!loading && filtered.length === 0 && (
+        {nextCursor && (
+          <button
+            onClick={() => loadRooms(search, nextCursor)}
+            className="w-full p-2 rounded bg-gray-800 hover:bg-gray-700 text-sm text-gray-300 disabled:opacity-50"
+            disabled={loading}
+          >
+            Load more
+          </button>
+        )}
+
+        {!loading && rooms.length === 0 && (
           <div className="text-gray-500 text-sm mt-3">No rooms match your search.</div>
         )}
       </div>
@@ -14,9 +14,13 @@ export default function Chat({ chatId, onBack }) {
 
   const [message, setMessage] = useState("");
   const [chat, setChat] = useState([]);
+  const [olderBeforeId, setOlderBeforeId] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   const wsRef = useRef(null);
   const scrollRef = useRef(null);
+  // Distance from the bottom to keep when older messages are prepended.
+  const keepScrollRef = useRef(null);
 
   useEffect(() => {
     if (!token) return;
@@ -29,9 +33,11 @@ export default function Chat({ chatId, onBack }) {
     }
   }, [token]);
 
-  const loadHistory = async (key) => {
+  // The newest page by default; pass beforeId to prepend the page before it.
+  const loadHistory = async (key, beforeId = null) => {
     try {
       const resp = await api.get(`/chat/${chatId}/history`, {
+        params: { before_id: beforeId || undefined },
         headers: { Authorization: `Bearer ${token}` },
       });
 
@@ -57,18 +63,36 @@ export default function Chat({ chatId, onBack }) {
         };
       });
 
-      setChat(decrypted);
+      if (beforeId) {
+        const el = scrollRef.current;
+        keepScrollRef.current = el ? el.scrollHeight - el.scrollTop : null;
+        setChat((prev) => [...decrypted, ...prev]);
+      } else {
+        setChat(decrypted);
+      }
+      setOlderBeforeId(resp.data.has_more ? resp.data.next_before_id : null);
     } catch (e) {
       console.error("History load error:", e);
     }
   };
 
+  const loadOlder = async () => {
+    if (!olderBeforeId || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      await loadHistory(symmetricKey, olderBeforeId);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   useEffect(() => {
     if (!token) return;
 
     const init = async () => {
       try {
         setChat([]);
+        setOlderBeforeId(null);
 
         const res = await api.get(`/chat/${chatId}/key`, {
           headers: { Authorization: `Bearer ${token}` },
@@ -126,9 +150,32 @@ export default function Chat({ chatId, onBack }) {
             { id: payload.id, fromUserId: null, text: payload.note },
           ]);
         }
+
+        if (payload.type === "message_failed") {
+          setChat((prev) => [
+            ...prev,
+            { id: null, fromUserId: null, text: "Your last message could not be saved, please send it again." },
+          ]);
+        }
+
+        if (payload.type === "rate_limited") {
+          setChat((prev) => [
+            ...prev,
+            { id: null, fromUserId: null, text: "Sending too fast: your last message was not sent." },
+          ]);
+        }
       },
 
-      onClose: () => console.log("WS closed:", chatId),
+      onClose: (e) => {
+        console.log("WS closed:", chatId, e.code);
+        // 1013: the server is at capacity; 1008: repeated rate limiting.
+        if (e.code === 1013 || e.code === 1008) {
+          setChat((prev) => [
+            ...prev,
+            { id: null, fromUserId: null, text: "Disconnected by the server, please rejoin the room later." },
+          ]);
+        }
+      },
       onError: (e) => console.error("WS error:", e),
     });
 
@@ -143,8 +190,14 @@ export default function Chat({ chatId, onBack }) {
   }, [token, symmetricKey, chatId, filterEnabled]);
 
   useEffect(() => {
-    if (scrollRef.current)
-      scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
+    const el = scrollRef.current;
+    if (!el) return;
+    if (keepScrollRef.current !== null) {
+      el.scrollTop = el.scrollHeight - keepScrollRef.current;
+      keepScrollRef.current = null;
+    } else {
+      el.scrollTop = el.scrollHeight;
+    }
   }, [chat]);
 
   const handleSend = () => {
@@ -205,6 +258,16 @@ export default function Chat({ chatId, onBack }) {
       </div>
 
       <div ref={scrollRef} className="flex-1 overflow-y-auto p-4 space-y-4 chat-scroll">
+        {olderBeforeId && (
+          <button
+            onClick={loadOlder}
+            className="w-full p-2 rounded bg-gray-800 hover:bg-gray-700 text-sm text-gray-300 disabled:opacity-50"
+            disabled={loadingOlder}
+          >
+            Load older messages
+          </button>
+        )}
+
         {chat.map((m, i) => {
           const isMe = m.fromUserId === currentUserId;
           return (